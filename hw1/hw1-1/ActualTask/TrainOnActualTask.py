@@ -6,20 +6,18 @@ Created on Thu Mar 22 14:43:06 2018
 """
 
 import tensorflow as tf
-from tensorflow.examples.tutorials.mnist import input_data
+import mnist_cache
 import numpy as np
 from deep import Deep
 from shallow import Shallow
 import os
-
-def safe_log(x, eps= 1e-12):
-    return tf.log( x + eps)
+import utils
 
 EPOCH = 1
 batch_size= 500
 
-mnist = input_data.read_data_sets("./MNIST_data", one_hot=True)
-train_x = np.asarray([np.reshape(image, (28,28,1)) for image in mnist.train.images])
+mnist = mnist_cache.load("./MNIST_data")
+train_x = mnist.train.images_nhwc
 train_y = mnist.train.labels
 
 loss_record = {}
@@ -31,12 +29,12 @@ with graph.as_default():
     y_placeholder = tf.placeholder(tf.float32, (None, 10), 'y_placeholder')
     
     deep = Deep()
-    logits = deep(x_placeholder)
-    cross_entropy = tf.reduce_sum(- y_placeholder * safe_log(logits))
+    logits, probabilities = deep(x_placeholder)
+    cross_entropy = tf.reduce_sum(utils.softmax_cross_entropy(y_placeholder, logits))
     optimizer = tf.train.AdamOptimizer(learning_rate=0.001, beta1= 0.5)
     train_step = optimizer.minimize(cross_entropy)
     
-    correct_prediction = tf.equal(tf.argmax(logits, 1), tf.argmax(y_placeholder, 1))
+    correct_prediction = tf.equal(tf.argmax(probabilities, 1), tf.argmax(y_placeholder, 1))
     acc = tf.reduce_mean(tf.cast(correct_prediction, tf.float32))
 
 with tf.Session(graph= graph) as sess:
@@ -51,8 +49,7 @@ with tf.Session(graph= graph) as sess:
         #for idx in range(train_x.shape[0] // batch_size):
             #x = train_x[idx * batch_size: (idx + 1) * batch_size]
             #y = train_y[idx * batch_size: (idx + 1) * batch_size]
-        batch_x, batch_y = mnist.train.next_batch(batch_size)
-        batch_x = np.asarray([np.reshape(image, (28,28,1)) for image in batch_x])
+        batch_x, batch_y = mnist.train.next_batch(batch_size, nhwc= True)
         feed_dict = {x_placeholder:batch_x, y_placeholder:batch_y}
         _, loss, train_acc = sess.run([train_step, cross_entropy, acc], feed_dict=feed_dict)
         total_loss += loss / batch_size
@@ -73,12 +70,12 @@ with graph.as_default():
     y_placeholder = tf.placeholder(tf.float32, (None, 10), 'y_placeholder')
     
     shallow = Shallow()
-    logits = shallow(x_placeholder)
-    cross_entropy = tf.reduce_sum(- y_placeholder * safe_log(logits))
+    logits, probabilities = shallow(x_placeholder)
+    cross_entropy = tf.reduce_sum(utils.softmax_cross_entropy(y_placeholder, logits))
     optimizer = tf.train.AdamOptimizer(learning_rate=0.001, beta1= 0.5)
     train_step = optimizer.minimize(cross_entropy)
     
-    correct_prediction = tf.equal(tf.argmax(logits, 1), tf.argmax(y_placeholder, 1))
+    correct_prediction = tf.equal(tf.argmax(probabilities, 1), tf.argmax(y_placeholder, 1))
     acc = tf.reduce_mean(tf.cast(correct_prediction, tf.float32))
 
 with tf.Session(graph= graph) as sess:
@@ -93,8 +90,7 @@ with tf.Session(graph= graph) as sess:
         #for idx in range(train_x.shape[0] // batch_size):
             #x = train_x[idx * batch_size: (idx + 1) * batch_size]
             #y = train_y[idx * batch_size: (idx + 1) * batch_size]
-        batch_x, batch_y = mnist.train.next_batch(batch_size)
-        batch_x = np.asarray([np.reshape(image, (28,28,1)) for image in batch_x])
+        batch_x, batch_y = mnist.train.next_batch(batch_size, nhwc= True)
         feed_dict = {x_placeholder:batch_x, y_placeholder:batch_y}
         _, loss, train_acc = sess.run([train_step, cross_entropy, acc], feed_dict=feed_dict)
         total_loss += loss / batch_size
@@ -29,7 +29,8 @@ class Deep:
             flatten = tf.reshape(conv2_2, (-1, featuremap_size), name= 'flatten')
             #dense1 = utils.dense(flatten, 120, 'dense1', reuse=self.reuse)
             #dense2 = utils.dense(dense1, 86, 'dense2', reuse=self.reuse)
-            output = utils.dense(flatten, 10, 'output', reuse=self.reuse, activation= 'softmax')
+            logits = utils.dense(flatten, 10, 'output', reuse=self.reuse, activation= 'linear')
+            probabilities = tf.nn.softmax(logits, name= 'probabilities')
         
         self.reuse = True
-        return output
\ No newline at end of file
+        return logits, probabilities
\ No newline at end of file
@@ -20,7 +20,8 @@ class Shallow:
             #max_pool1 = utils.pooling(conv1_1, 'max', [1,2,2,1], [1,2,2,1], name= 'max_pool1')
             featuremap_size = np.prod(conv1_1.get_shape()[1:4])
             flatten = tf.reshape(conv1_1, (-1, featuremap_size), name= 'flatten')
-            output = utils.dense(flatten, 10, 'output', reuse=self.reuse, activation= 'softmax')
+            logits = utils.dense(flatten, 10, 'output', reuse=self.reuse, activation= 'linear')
+            probabilities = tf.nn.softmax(logits, name= 'probabilities')
         
         self.reuse = True
-        return output
\ No newline at end of file
+        return logits, probabilities
\ No newline at end of file
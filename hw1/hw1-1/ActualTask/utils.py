@@ -41,4 +41,7 @@ def dense(input, unit, name, reuse, activation='relu'):
             output = tf.nn.softmax(output)
             
         return output
-    
+
+def softmax_cross_entropy(labels, logits):
+    # Per sample cross entropy over the last axis
+    return tf.nn.softmax_cross_entropy_with_logits_v2(labels= tf.stop_gradient(labels), logits= logits)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import tensorflow as tf
+import numpy as np
+from numpy import linalg as LA
+
+
+class HessianVectorProduct:
+    # H v of loss w.r.t. the full flattened parameter vector, built once as
+    # a graph op fed through the vector placeholder. The Hessian itself is
+    # never materialized, cross-variable blocks are included.
+    def __init__(self, loss, var_list= None):
+        if var_list is None:
+            var_list = tf.trainable_variables()
+        self.var_list = var_list
+        shapes = [v.get_shape().as_list() for v in var_list]
+        sizes = [int(np.prod(shape)) for shape in shapes]
+        self.n_params = sum(sizes)
+        
+        self.vector = tf.placeholder(tf.float32, (self.n_params,), name= 'hvp_vector')
+        vectors = [tf.reshape(v, shape) for v, shape in zip(tf.split(self.vector, sizes), shapes)]
+        grads = tf.gradients(ys= loss, xs= var_list)
+        grad_dot_vector = tf.add_n([tf.reduce_sum(grad * v) for grad, v in zip(grads, vectors)])
+        hvps = tf.gradients(ys= grad_dot_vector, xs= var_list)
+        self.hvp = tf.concat([tf.reshape(hvp, [-1]) for hvp in hvps], axis= 0)
+        
+    def __call__(self, sess, vector, feed_dict= None):
+        feed_dict = dict(feed_dict or {})
+        feed_dict[self.vector] = vector.astype(np.float32)
+        return sess.run(self.hvp, feed_dict= feed_dict).astype(np.float64)
+
+
+def lanczos(matvec, v, n_iter):
+    # Tridiagonal T of n_iter Lanczos steps from v, with full
+    # reorthogonalization. Returns the Ritz values and the squared first
+    # components of their eigenvectors (quadrature weights).
+    n_iter = min(n_iter, len(v))
+    V = np.zeros((n_iter, len(v)))
+    alpha = []
+    beta = []
+    v = v / LA.norm(v)
+    for j in range(n_iter):
+        V[j] = v
+        w = matvec(v)
+        alpha.append(np.dot(w, v))
+        w = w - alpha[-1] * v
+        if j > 0:
+            w = w - beta[-1] * V[j - 1]
+        w = w - np.dot(V[:j + 1].T, np.dot(V[:j + 1], w))
+        b = LA.norm(w)
+        if j == n_iter - 1 or b < 1e-10:
+            break
+        beta.append(b)
+        v = w / b
+    
+    T = np.diag(alpha) + np.diag(beta[:len(alpha) - 1], 1) + np.diag(beta[:len(alpha) - 1], -1)
+    ritz_values, ritz_vectors = LA.eigh(T)
+    return ritz_values, ritz_vectors[0]**2
+
+
+def extreme_eigenvalues(matvec, n_params, n_iter= 50):
+    # Smallest and largest Hessian eigenvalue from the Ritz values
+    ritz_values, _ = lanczos(matvec, np.random.normal(size= n_params), n_iter)
+    return ritz_values[0], ritz_values[-1]
+
+
+def positive_fraction(matvec, n_params, n_iter= 50, n_probe= 10):
+    # Fraction of positive eigenvalues by stochastic Lanczos quadrature: the
+    # spectral density seen from random Rademacher probes
+    fraction = 0
+    for _ in range(n_probe):
+        probe = np.random.choice([-1., 1.], size= n_params)
+        ritz_values, weights = lanczos(matvec, probe, n_iter)
+        fraction += np.sum(weights[ritz_values > 0])
+    return fraction / n_probe
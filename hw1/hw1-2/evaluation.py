@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+class Evaluator:
+    # Streams a dataset through metric ops in fixed size chunks and returns
+    # their sample weighted means, metrics have to be means over the batch
+    # (accuracy, mean cross entropy). With subset_size, calls for an epoch
+    # use a random subset of that many samples and every full_every-th
+    # epoch still does a full pass.
+    def __init__(self, x_placeholder, y_placeholder, metrics, batch_size= 1024, subset_size= None, full_every= 1):
+        self.x_placeholder = x_placeholder
+        self.y_placeholder = y_placeholder
+        self.metrics = metrics
+        self.batch_size = batch_size
+        self.subset_size = subset_size
+        self.full_every = full_every
+
+    def chunks(self, x, y, indices= None, batch_size= None):
+        # feed_dicts of x, or of its rows in indices, which are gathered one
+        # chunk at a time
+        if batch_size is None:
+            batch_size = self.batch_size
+        count = len(x) if indices is None else len(indices)
+        for idx in range(0, count, batch_size):
+            if indices is None:
+                batch_x = x[idx:idx + batch_size]
+                batch_y = y[idx:idx + batch_size]
+            else:
+                batch_x = x[indices[idx:idx + batch_size]]
+                batch_y = y[indices[idx:idx + batch_size]]
+            yield {self.x_placeholder: batch_x, self.y_placeholder: batch_y}
+
+    def evaluate(self, sess, x, y, indices= None, batch_size= None):
+        # Sample weighted means over x, or over its rows in indices
+        count = len(x) if indices is None else len(indices)
+        total = np.zeros(len(self.metrics))
+        for feed_dict in self.chunks(x, y, indices, batch_size):
+            total += np.asarray(sess.run(self.metrics, feed_dict= feed_dict)) * len(feed_dict[self.x_placeholder])
+        return total / count
+
+    def gradient_norm(self, sess, grads, x, y, mean= False):
+        # Norm of the full-batch gradient from per-chunk gradients: summed
+        # for a reduce_sum loss, sample weighted for a reduce_mean one
+        total = None
+        for feed_dict in self.chunks(x, y):
+            chunk_grads = sess.run(grads, feed_dict= feed_dict)
+            if mean:
+                chunk_grads = [grad * (len(feed_dict[self.x_placeholder]) / len(x)) for grad in chunk_grads]
+            total = chunk_grads if total is None else [a + b for a, b in zip(total, chunk_grads)]
+        return np.sqrt(sum(np.sum(np.square(grad)) for grad in total))
+
+    def is_full(self, epoch):
+        return self.subset_size is None or epoch is None or epoch % self.full_every == 0
+
+    def __call__(self, sess, x, y, epoch= None):
+        if self.is_full(epoch) or self.subset_size >= len(x):
+            return self.evaluate(sess, x, y)
+        # Sorted, so the gathers walk x forward
+        indices = np.sort(np.random.choice(len(x), self.subset_size, replace= False))
+        return self.evaluate(sess, x, y, indices)
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import tensorflow as tf
+
+
+def build_train_step(loss, optimizer, var_list= None):
+    # optimizer.minimize, but the gradients are kept so that their global
+    # norm can be fetched in the same sess.run as the train step
+    grads_and_vars = optimizer.compute_gradients(loss, var_list= var_list)
+    train_step = optimizer.apply_gradients(grads_and_vars)
+    grad_norm = global_gradient_norm(grads_and_vars)
+    return train_step, grad_norm
+
+
+def global_gradient_norm(grads_and_vars):
+    return tf.global_norm([grad for grad, _ in grads_and_vars if grad is not None])
+
+
+def gradients(loss, var_list= None):
+    # d loss / d var for every variable of var_list
+    if var_list is None:
+        var_list = tf.trainable_variables()
+    return tf.gradients(ys= loss, xs= var_list)
+
+
+def gradient_norm(loss, var_list= None):
+    # ||d loss / d var_list|| as a single tensor, built once
+    if var_list is None:
+        var_list = tf.trainable_variables()
+    return global_gradient_norm(zip(gradients(loss, var_list), var_list))
+
+
+def flat_weights(var_list= None, ensemble_size= None):
+    # All variables concatenated into one [n_params] vector, or one
+    # [ensemble_size, n_params] row per replica of an ensemble model
+    if var_list is None:
+        var_list = tf.trainable_variables()
+    if ensemble_size is None:
+        return tf.concat([tf.reshape(v, [-1]) for v in var_list], axis= 0)
+    return tf.concat([tf.reshape(v, [ensemble_size, -1]) for v in var_list], axis= 1)
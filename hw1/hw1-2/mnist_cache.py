@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import collections
+import gzip
+import os
+
+# Same split as input_data.read_data_sets: the first 5000 training images
+# are the validation set
+validation_size = 5000
+files = {'train': ('train-images-idx3-ubyte.gz', 'train-labels-idx1-ubyte.gz'),
+         'test': ('t10k-images-idx3-ubyte.gz', 't10k-labels-idx1-ubyte.gz')}
+
+Datasets = collections.namedtuple('Datasets', ['train', 'validation', 'test'])
+
+class DataSet:
+    # images [N, 784] float32 in [0, 1] and int_labels [N] uint8 are memory
+    # mapped from the cache, images_nhwc is a [N, 28, 28, 1] view of images
+    def __init__(self, images, int_labels):
+        self.images = images
+        self.int_labels = int_labels
+        self.labels = np.eye(10, dtype= np.float32)[int_labels]
+        self.num_examples = len(images)
+        self._order = np.random.permutation(self.num_examples)
+        self._index = 0
+
+    @property
+    def images_nhwc(self):
+        return self.images.reshape(-1, 28, 28, 1)
+
+    def next_batch(self, batch_size, nhwc= False):
+        # Reshuffled every epoch, only the batch itself is gathered
+        if self._index + batch_size > self.num_examples:
+            self._order = np.random.permutation(self.num_examples)
+            self._index = 0
+        batch = self._order[self._index:self._index + batch_size]
+        self._index += batch_size
+        images = self.images_nhwc if nhwc else self.images
+        return images[batch], self.labels[batch]
+
+def read_idx(path):
+    # IDX file: 2 zero bytes, dtype code, rank, rank big endian int32 dims
+    with gzip.open(path, 'rb') as f:
+        data = f.read()
+    rank = data[3]
+    shape = np.frombuffer(data, dtype= '>i4', count= rank, offset= 4)
+    return np.frombuffer(data, dtype= np.uint8, offset= 4 + 4 * rank).reshape(shape)
+
+def save(path, array):
+    # Written under a temporary name, processes building the cache at the
+    # same time never see a partial file
+    temp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(temp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(temp_path, path)
+
+def cache_path(data_dir, split, kind):
+    return os.path.join(data_dir, '%s_%s.npy' % (split, kind))
+
+def build_cache(data_dir):
+    # Decompresses the gzip IDX files once into float32 images and uint8 labels
+    if not all(os.path.isfile(os.path.join(data_dir, name)) for pair in files.values() for name in pair):
+        from tensorflow.examples.tutorials.mnist import input_data
+        input_data.read_data_sets(data_dir)
+    for split, (image_file, label_file) in files.items():
+        images = read_idx(os.path.join(data_dir, image_file)).reshape(-1, 784)
+        save(cache_path(data_dir, split, 'images'), np.multiply(images.astype(np.float32), 1.0 / 255.0))
+        save(cache_path(data_dir, split, 'labels'), read_idx(os.path.join(data_dir, label_file)))
+
+def load(data_dir= './MNIST_data'):
+    # train / validation / test DataSets without copying the cached arrays,
+    # the cache is built on first use
+    if not all(os.path.isfile(cache_path(data_dir, split, kind)) for split in files for kind in ['images', 'labels']):
+        build_cache(data_dir)
+    arrays = {}
+    for split in files:
+        arrays[split] = (np.load(cache_path(data_dir, split, 'images'), mmap_mode= 'r'),
+                         np.load(cache_path(data_dir, split, 'labels'), mmap_mode= 'r'))
+    train_images, train_labels = arrays['train']
+    return Datasets(train= DataSet(train_images[validation_size:], train_labels[validation_size:]),
+                    validation= DataSet(train_images[:validation_size], train_labels[:validation_size]),
+                    test= DataSet(*arrays['test']))
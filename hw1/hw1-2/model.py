@@ -10,34 +10,37 @@ import tensorflow as tf
 import ops
 
 class Model:
-    def __init__(self):
+    def __init__(self, ensemble_size= None):
         self.reuse = False
         self.name = 'Model'
+        self.ensemble_size = ensemble_size # K stacked replicas, input [K, batch, in]
         
     def __call__(self, input):
         with tf.variable_scope(self.name, reuse= self.reuse):
             input_shape = input.get_shape().as_list()
-            dense1 = ops.dense(input, [input_shape[-1], 20], 'dense1', reuse= self.reuse)
-            dense2 = ops.dense(dense1, [20, 20], 'dense2', reuse= self.reuse)
-            dense3 = ops.dense(dense2, [20, 20], 'dense3', reuse= self.reuse)
-            output = ops.dense(dense3, [20, 10], 'output', activation='softmax', reuse= self.reuse)
+            dense1 = ops.dense(input, [input_shape[-1], 20], 'dense1', reuse= self.reuse, ensemble_size= self.ensemble_size)
+            dense2 = ops.dense(dense1, [20, 20], 'dense2', reuse= self.reuse, ensemble_size= self.ensemble_size)
+            dense3 = ops.dense(dense2, [20, 20], 'dense3', reuse= self.reuse, ensemble_size= self.ensemble_size)
+            logits = ops.dense(dense3, [20, 10], 'output', activation='linear', reuse= self.reuse, ensemble_size= self.ensemble_size)
+            probabilities = tf.nn.softmax(logits, name= 'probabilities')
             
         self.reuse = True
-        return output
+        return logits, probabilities
     
     
 class SimulateFunctionModel:
-    def __init__(self):
+    def __init__(self, ensemble_size= None):
         self.reuse = False
         self.name = 'SimulateFunctionModel'
+        self.ensemble_size = ensemble_size # K stacked replicas, input [K, batch, in]
         
     def __call__(self, input):
         with tf.variable_scope(self.name, reuse= self.reuse):
             input_shape = input.get_shape().as_list()
-            dense1 = ops.dense(input, [input_shape[-1], 20], 'dense1', reuse= self.reuse)
-            dense2 = ops.dense(dense1, [20, 20], 'dense2', reuse= self.reuse)
-            dense3 = ops.dense(dense2, [20, 20], 'dense3', reuse= self.reuse)
-            output = ops.dense(dense3, [20, 1], 'output', activation='linear', reuse= self.reuse)
+            dense1 = ops.dense(input, [input_shape[-1], 20], 'dense1', reuse= self.reuse, ensemble_size= self.ensemble_size)
+            dense2 = ops.dense(dense1, [20, 20], 'dense2', reuse= self.reuse, ensemble_size= self.ensemble_size)
+            dense3 = ops.dense(dense2, [20, 20], 'dense3', reuse= self.reuse, ensemble_size= self.ensemble_size)
+            output = ops.dense(dense3, [20, 1], 'output', activation='linear', reuse= self.reuse, ensemble_size= self.ensemble_size)
             
         self.reuse = True
         return output
@@ -31,18 +31,27 @@ def pooling(input, type, name, ksize= [1,2,2,1], stride= [1,2,2,1], padding= 'SA
     if type == 'average':
         return tf.nn.avg_pool(input, ksize, stride, padding, name= name)
     
-def dense(input, weight_shape, name, reuse, activation= 'relu'):
+def dense(input, weight_shape, name, reuse, activation= 'relu', ensemble_size= None):
+    # ensemble_size K stacks K independent copies of the layer: weights get
+    # a leading [K] axis and input [K, batch, in] goes through one batched
+    # matmul. A [batch, in] input is shared by all K copies.
     shape = np.asarray(weight_shape)
+    ensemble_shape = [] if ensemble_size is None else [ensemble_size]
     with tf.variable_scope(name, reuse= reuse):
         
         flatten_weight = tf.get_variable('flatten_weight',
-                         shape= np.prod(shape),
+                         shape= ensemble_shape + [np.prod(shape)],
                          initializer=tf.truncated_normal_initializer(stddev=0.02))
-        weight = tf.reshape(flatten_weight, shape, name= 'weight')
+        weight = tf.reshape(flatten_weight, ensemble_shape + list(shape), name= 'weight')
         bias = tf.get_variable('bias',
-                     shape= shape[-1],
+                     shape= ensemble_shape + [shape[-1]],
                      initializer= tf.constant_initializer(0))
-        output = tf.matmul(input, weight) + bias
+        if ensemble_size is None:
+            output = tf.matmul(input, weight) + bias
+        else:
+            if len(input.get_shape()) == 2:
+                input = tf.tile(tf.expand_dims(input, 0), [ensemble_size, 1, 1])
+            output = tf.matmul(input, weight) + tf.expand_dims(bias, 1)
         """
         output = tf.layers.dense(input, shape[-1])
         """
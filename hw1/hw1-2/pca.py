@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import numpy as np
+from numpy import linalg as LA
+
+
+def trajectory_pca(weights_record, n_components= 2):
+    # PCA of weight snapshots solved in snapshot space: the eigenvectors of
+    # the [n_snapshots, n_snapshots] Gram matrix give the principal
+    # directions without ever forming an n_params x n_params matrix.
+    # weights_record is a list of [n_snapshots, n_params] runs, all runs are
+    # projected onto one shared basis.
+    weights = np.concatenate([np.asarray(weights) for weights in weights_record])
+    mean = np.mean(weights, axis= 0)
+    S = weights - mean
+    
+    eig_val, eig_vec = LA.eigh(np.dot(S, S.T))
+    sort_order = np.argsort(eig_val)[::-1][:n_components]
+    scale = np.sqrt(np.maximum(eig_val[sort_order], 1e-12))
+    
+    # Unit principal directions [n_params, n_components] and the points
+    basis = np.dot(S.T, eig_vec[:, sort_order]) / scale
+    points = eig_vec[:, sort_order] * scale
+    
+    split = np.cumsum([len(weights) for weights in weights_record])[:-1]
+    return np.split(points, split), basis, mean
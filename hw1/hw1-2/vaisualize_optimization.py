@@ -7,101 +7,85 @@ Created on Sat Mar 24 16:58:02 2018
 """
 
 import tensorflow as tf
-from tensorflow.examples.tutorials.mnist import input_data
+import mnist_cache
 from model import Model
 import numpy as np
 import utils
+import instrumentation
 
 
 train_data_size = 1000
 
-mnist = input_data.read_data_sets('MNIST_data', one_hot=True)
+mnist = mnist_cache.load('MNIST_data')
 train_x = mnist.train.images
 train_y = mnist.train.labels
 
-random_order = np.arange(train_x.shape[0])
-np.random.shuffle(random_order)
-train_x = train_x[random_order]
-train_x = train_x[0:train_data_size]
-
-train_y = train_y[random_order][0:train_data_size]
+subset = np.random.permutation(train_x.shape[0])[0:train_data_size]
+train_x = train_x[subset]
+train_y = train_y[subset]
 
 #%%
+EPOCH = 30
+batch_size = 200
+N_run = 8
+
+# All runs are replicas of one ensemble model trained side by side, each
+# with its own initialization and data order
 graph = tf.Graph()
 with graph.as_default():
-    input = tf.placeholder(tf.float32, (None, 784), 'input')
-    labels = tf.placeholder(tf.float32, (None, 10), 'label')
-    model = Model()
-    logits = model(input)
+    input = tf.placeholder(tf.float32, (N_run, None, 784), 'input')
+    labels = tf.placeholder(tf.float32, (N_run, None, 10), 'label')
+    model = Model(ensemble_size= N_run)
+    logits, probabilities = model(input)
     
-    cross_entropy = tf.reduce_sum(- labels * utils.safe_log(logits))
+    cross_entropy = tf.reduce_sum(utils.softmax_cross_entropy(labels, logits), axis= 1)
     optimizer = tf.train.AdamOptimizer(learning_rate=0.02)
-    train_step = optimizer.minimize(cross_entropy)
+    train_step = optimizer.minimize(tf.reduce_sum(cross_entropy))
+    weights = instrumentation.flat_weights(ensemble_size= N_run)
     
     accuracy = tf.reduce_mean(
                     tf.cast(
                         tf.equal(
-                                tf.arg_max(logits,dimension= 1),
-                                tf.arg_max(labels,dimension= 1)
+                                tf.arg_max(probabilities,dimension= 2),
+                                tf.arg_max(labels,dimension= 2)
                         ),
                         tf.float32
-                    )
+                    ),
+                    axis= 1
                 )
-                    
-EPOCH = 30
-batch_size = 200
 
-weights_record = []
-train_acc_record = []
-
-random_order = np.arange(train_data_size)
-for i in range(8):
-    with tf.Session(graph= graph) as sess:
-        sess.run(tf.global_variables_initializer())
-        temp_weights_record = []
-        temp_acc_record = []
-        for epoch in range(1, EPOCH + 1):
-            total_loss = 0
-            for idx in range(train_data_size // batch_size):
-                x = train_x[idx*batch_size : (idx+1) * batch_size]
-                y = train_y[idx*batch_size : (idx+1) * batch_size]
-                feed_dict = {input: x, labels: y}
-                _, loss = sess.run([train_step, cross_entropy], feed_dict= feed_dict)
-                total_loss += loss / batch_size
-            
-            
-            feed_dict = {input: train_x, labels: train_y}
-            train_acc = sess.run(accuracy, feed_dict= feed_dict)
-            print('epoch:', epoch, ',loss:', loss, 'train_acc:', train_acc)
-            
-            np.random.shuffle(random_order)
-            train_x = train_x[random_order]
-            train_y = train_y[random_order]
-            
-            if epoch % 3 == 0:
-                variables = np.asarray([])
-                for v in tf.trainable_variables():
-                    variables = np.concatenate((variables, sess.run(tf.reshape(v, [-1]))))
-                temp_weights_record.append(variables)
-                temp_acc_record.append(train_acc)
-                
-    weights_record.append(temp_weights_record)
-    train_acc_record.append(temp_acc_record)
+weights_record = [[] for _ in range(N_run)]
+train_acc_record = [[] for _ in range(N_run)]
+
+# Per-replica data orders, [N_run, train_data_size] indices reshuffled in place
+random_order = np.stack([np.random.permutation(train_data_size) for _ in range(N_run)])
+with tf.Session(graph= graph) as sess:
+    sess.run(tf.global_variables_initializer())
+    for epoch in range(1, EPOCH + 1):
+        total_loss = 0
+        for x, y in utils.epoch_batches(train_x, train_y, batch_size, random_order):
+            feed_dict = {input: x, labels: y}
+            _, loss = sess.run([train_step, cross_entropy], feed_dict= feed_dict)
+            total_loss += loss / batch_size
+        
+        
+        feed_dict = {input: np.broadcast_to(train_x, (N_run,) + train_x.shape),
+                     labels: np.broadcast_to(train_y, (N_run,) + train_y.shape)}
+        train_acc = sess.run(accuracy, feed_dict= feed_dict)
+        print('epoch:', epoch, ',loss:', loss, 'train_acc:', train_acc)
+        
+        for i in range(N_run):
+            np.random.shuffle(random_order[i])
+        
+        if epoch % 3 == 0:
+            run_weights = sess.run(weights)
+            for i in range(N_run):
+                weights_record[i].append(run_weights[i])
+                train_acc_record[i].append(train_acc[i])
     
 #%%
-from numpy import linalg as LA
-points_record = []
-for i in range(8):
-    weights = np.asarray(weights_record[i])
-    S = (weights -  np.mean(weights, axis= 0)).transpose()
-    U = np.dot(S, S.transpose())
-    eig_val, eig_vec = LA.eigh(U)
-    
-    sort_order = np.argsort(eig_val)[::-1]
-    W = (eig_vec[sort_order])[:,0:2]
-    
-    points = np.dot(weights, W)
-    points_record.append(points)
+from pca import trajectory_pca
+points_record, _, _ = trajectory_pca(weights_record, n_components= 2)
     
 #%%
 import matplotlib.pyplot as plt
@@ -8,8 +8,10 @@ Created on Mon Mar 26 17:18:57 2018
 
 import tensorflow as tf
 import numpy as np
-from numpy import linalg as LA
+import multiprocessing
 from model import SimulateFunctionModel
+import curvature
+import utils
 
 def objective_function(x):
     return x**2 + x - 1
@@ -18,28 +20,28 @@ train_data_size = 1000
 batch_size= 100
 EPOCH = 1000
 gradient_threshold = 0.05
+lanczos_iter = 50
+lanczos_probe = 10
+N_restart = 100
+N_worker = 1 # > 1: restarts are spread over a process pool
 
-train_x = np.random.normal(scale= 10, size= (train_data_size, 1))
-train_y = objective_function(train_x)
-
-random_order = np.arange(train_data_size)
 #%%
-minimal_ratio_record = []
-loss_record = []
-for time in range(100):
+def build_graph():
+    # Built once, every restart only re-runs the initializer, which also
+    # resets both optimizers' slots
     graph = tf.Graph()
     with graph.as_default():
         x_placeholder = tf.placeholder(tf.float32, (None, 1), name= 'x_placeholder')
         y_placeholder = tf.placeholder(tf.float32, (None, 1), name= 'y_placeholder')
-        
+
         model = SimulateFunctionModel()
         prediction = model(x_placeholder)
-        
+
         mse_loss = tf.reduce_mean(tf.squared_difference(y_placeholder, prediction))
         train_optimizer = tf.train.AdamOptimizer(learning_rate=0.005)
         train_step = train_optimizer.minimize(mse_loss)
-        
-        
+
+
         total_grad_norm = tf.constant(0, dtype= tf.float32)
         for variable in tf.trainable_variables():
             [grad] = tf.gradients(ys= mse_loss, xs= variable)
@@ -47,53 +49,101 @@ for time in range(100):
         total_grad_norm = tf.sqrt(total_grad_norm)
         grad_optimizer = tf.train.AdamOptimizer(learning_rate= 1)
         min_grad = grad_optimizer.minimize(total_grad_norm)
-        
-        writer = tf.summary.FileWriter("TensorBoard/", graph = graph)
-    
-    with tf.Session(graph= graph) as sess:
-        sess.run(tf.global_variables_initializer())
-        for epoch in range(1, EPOCH+1):
-            np.random.shuffle(random_order)
-            train_x = train_x[random_order]
-            train_y = train_y[random_order]
-        
-            total_loss = 0
-            for idx in range(train_data_size//batch_size):
-                x = train_x[idx * batch_size : (idx+1) * batch_size]
-                y = train_y[idx * batch_size : (idx+1) * batch_size]
-                
-                feed_dict= {x_placeholder: x, y_placeholder:y}
-                _, loss= sess.run([train_step, mse_loss], feed_dict= feed_dict)
-                
-                total_loss += (loss / batch_size)
-            print('epoch:', epoch, 'loss:', total_loss)
-        loss_record.append(total_loss)
-        # Find where gradient is 0
-        while True:
-            feed_dict= {x_placeholder: train_x, y_placeholder:train_y}
-            _, gradient_norm = sess.run([min_grad, total_grad_norm], feed_dict= feed_dict)  
-            print('gradient_norm:', gradient_norm)
-            
-            if gradient_norm <= gradient_threshold:
-                break
-            
-        # Calculate minima ratio w.r.t eigen values which are positive
-        eigen_values = np.asarray([])
-        for variable in tf.trainable_variables():
-            hess = sess.run(tf.hessians(mse_loss, variable), feed_dict= feed_dict)
-            eigen_values = np.append(eigen_values, (LA.eigvals(hess).reshape(-1,)))
-        
-        minimal_ratio = np.sum(eigen_values > 0) / np.prod(eigen_values.shape)
-        minimal_ratio_record.append(minimal_ratio)
-        
-#%%
-import matplotlib.pyplot as plt
-fig1 = plt.figure(1)
-plt.title('What happens when gradient is 0?')
-plt.ylabel('Loss')
-plt.xlabel('Minima Ratio')
-
-plt.scatter(minimal_ratio_record, loss_record)
-        
-fig1.savefig('Visualize When Gradient is 0.png')
-        
+        hessian_vector_product = curvature.HessianVectorProduct(mse_loss)
+
+        init = tf.global_variables_initializer()
+    graph.finalize()
+
+    return graph, {'x': x_placeholder,
+                   'y': y_placeholder,
+                   'mse_loss': mse_loss,
+                   'train_step': train_step,
+                   'total_grad_norm': total_grad_norm,
+                   'min_grad': min_grad,
+                   'hessian_vector_product': hessian_vector_product,
+                   'init': init}
+
+
+def run_restarts(N_time, train_x, train_y, log_dir= None, N_thread= 0):
+    graph, ops = build_graph()
+    if log_dir is not None:
+        writer = tf.summary.FileWriter(log_dir, graph = graph)
+        writer.close()
+
+    minimal_ratio_record = []
+    eigen_value_record = []
+    loss_record = []
+    config = tf.ConfigProto(intra_op_parallelism_threads= N_thread,
+                            inter_op_parallelism_threads= N_thread)
+    with tf.Session(graph= graph, config= config) as sess:
+        for time in range(N_time):
+            sess.run(ops['init'])
+            for epoch in range(1, EPOCH+1):
+                total_loss = 0
+                for x, y in utils.epoch_batches(train_x, train_y, batch_size):
+                    feed_dict= {ops['x']: x, ops['y']:y}
+                    _, loss= sess.run([ops['train_step'], ops['mse_loss']], feed_dict= feed_dict)
+
+                    total_loss += (loss / batch_size)
+                print('epoch:', epoch, 'loss:', total_loss)
+            loss_record.append(total_loss)
+            # Find where gradient is 0
+            while True:
+                feed_dict= {ops['x']: train_x, ops['y']:train_y}
+                _, gradient_norm = sess.run([ops['min_grad'], ops['total_grad_norm']], feed_dict= feed_dict)
+                print('gradient_norm:', gradient_norm)
+
+                if gradient_norm <= gradient_threshold:
+                    break
+
+            # Calculate minima ratio w.r.t eigen values which are positive, from
+            # Hessian-vector products over the full parameter vector
+            hessian_vector_product = ops['hessian_vector_product']
+            matvec = lambda v: hessian_vector_product(sess, v, feed_dict)
+            n_params = hessian_vector_product.n_params
+            minimal_ratio = curvature.positive_fraction(matvec, n_params, lanczos_iter, lanczos_probe)
+            min_eigen_value, max_eigen_value = curvature.extreme_eigenvalues(matvec, n_params, lanczos_iter)
+            print('minimal_ratio:', minimal_ratio, 'eigen_values:', min_eigen_value, max_eigen_value)
+            minimal_ratio_record.append(minimal_ratio)
+            eigen_value_record.append((min_eigen_value, max_eigen_value))
+
+    return minimal_ratio_record, eigen_value_record, loss_record
+
+
+if __name__ == '__main__':
+    train_x = np.random.normal(scale= 10, size= (train_data_size, 1))
+    train_y = objective_function(train_x)
+
+    #%%
+    minimal_ratio_record = []
+    eigen_value_record = []
+    loss_record = []
+    if N_worker > 1:
+        # Independent restarts, one graph and session per worker process
+        N_thread = max(1, multiprocessing.cpu_count() // N_worker)
+        N_times = [len(times) for times in np.array_split(np.arange(N_restart), N_worker)]
+        tasks = [(N_time, train_x, train_y, "TensorBoard/" if idx == 0 else None, N_thread)
+                 for idx, N_time in enumerate(N_times)]
+        with multiprocessing.get_context('spawn').Pool(N_worker) as pool:
+            for minimal_ratios, eigen_values, losses in pool.starmap(run_restarts, tasks):
+                minimal_ratio_record.extend(minimal_ratios)
+                eigen_value_record.extend(eigen_values)
+                loss_record.extend(losses)
+    else:
+        minimal_ratio_record, eigen_value_record, loss_record = run_restarts(N_restart, train_x, train_y, "TensorBoard/")
+
+    # One row per restart: minimal ratio, min / max Hessian eigenvalue, loss
+    np.savetxt('when_gradient_is_0_record.txt',
+               np.column_stack([minimal_ratio_record, eigen_value_record, loss_record]),
+               header= 'minimal_ratio min_eigen_value max_eigen_value loss')
+
+    #%%
+    import matplotlib.pyplot as plt
+    fig1 = plt.figure(1)
+    plt.title('What happens when gradient is 0?')
+    plt.ylabel('Loss')
+    plt.xlabel('Minima Ratio')
+
+    plt.scatter(minimal_ratio_record, loss_record)
+
+    fig1.savefig('Visualize When Gradient is 0.png')
@@ -6,17 +6,19 @@ Created on Wed Apr  4 15:10:49 2018
 """
 
 import tensorflow as tf
-from tensorflow.examples.tutorials.mnist import input_data
+import mnist_cache
 import utils
 from models import SimpleDNN
+from evaluation import Evaluator
 import numpy as np
 
 train_dataset_counts = 1000
 learning_rate = 0.003
 EPOCH = 5000
 batch_size = 100
+eval_batch_size = 1000
 
-mnist = input_data.read_data_sets('./MNIST_data', one_hot= True)
+mnist = mnist_cache.load('./MNIST_data')
 train_x = mnist.train.images[0:train_dataset_counts, :]
 train_y = mnist.train.labels[0:train_dataset_counts, :]
 
@@ -33,9 +35,9 @@ with graph.as_default():
     y_placeholder = tf.placeholder(tf.float32, (None, 10), 'y_placeholder')
     
     model = SimpleDNN()
-    logits = model(x_placeholder)
+    logits, probabilities = model(x_placeholder)
     
-    cross_entropy = tf.reduce_mean(tf.reduce_sum(-y_placeholder * utils.safe_log(logits), 1))
+    cross_entropy = tf.reduce_mean(utils.softmax_cross_entropy(y_placeholder, logits))
     optimizer = tf.train.AdamOptimizer(learning_rate)
     train_step = optimizer.minimize(cross_entropy)
     
@@ -43,11 +45,12 @@ with graph.as_default():
                     tf.cast(
                         tf.equal(
                             tf.arg_max(y_placeholder, dimension= 1),
-                            tf.arg_max(logits, dimension= 1)
+                            tf.arg_max(probabilities, dimension= 1)
                         ),
                         tf.float32
                     )  
                 )
+    evaluator = Evaluator(x_placeholder, y_placeholder, [accuracy, cross_entropy], eval_batch_size)
 
 train_loss_record = []
 test_loss_record = []
@@ -56,24 +59,15 @@ with tf.Session(graph= graph) as sess:
     
     for epoch in range(1, EPOCH+1, 1):
         
-        np.random.shuffle(random_order)
-        train_x = train_x[random_order]
-        train_y = train_y[random_order]
-        
         total_loss = 0.0
-        for idx in range(train_dataset_counts//batch_size):
-            x = train_x[idx*batch_size : (idx+1)*batch_size]
-            y = train_y[idx*batch_size : (idx+1)*batch_size]       
-            
+        for x, y in utils.epoch_batches(train_x, train_y, batch_size):
             feed_dict = {x_placeholder:x, y_placeholder:y}
             _, loss = sess.run([train_step, cross_entropy], feed_dict= feed_dict)
             total_loss += (loss / train_dataset_counts * batch_size)
-        feed_dict = {x_placeholder:train_x, y_placeholder:train_y}   
-        train_acc = sess.run(accuracy, feed_dict= feed_dict)
+        train_acc, _ = evaluator(sess, train_x, train_y)
         print('epoch:', epoch, ',loss:', total_loss, ',train_acc:', train_acc)
         
-        feed_dict = {x_placeholder:test_x, y_placeholder:test_y}   
-        test_loss = sess.run(cross_entropy, feed_dict= feed_dict)
+        _, test_loss = evaluator(sess, test_x, test_y)
         
         train_loss_record.append(total_loss)
         test_loss_record.append(test_loss)
@@ -6,21 +6,23 @@ Created on Fri Apr  6 00:12:01 2018
 """
 
 import tensorflow as tf
-from tensorflow.examples.tutorials.mnist import input_data
+import mnist_cache
 import utils
 from models import SimpleDNN
-import numpy as np
+from interpolation import Interpolation
+from evaluation import Evaluator
 
 train_dataset_counts = 55000
+eval_subset_size = 5000 # per epoch train accuracy on a random subset
+full_eval_every = 10 # and on the whole training set every 10 epochs
 
-mnist = input_data.read_data_sets('./MNIST_data', one_hot= True)
+mnist = mnist_cache.load('./MNIST_data')
 train_x = mnist.train.images[0:train_dataset_counts, :]
 train_y = mnist.train.labels[0:train_dataset_counts, :]
 
 test_x = mnist.test.images
 test_y = mnist.test.labels
 
-random_order = np.arange(train_dataset_counts)
 
 graphs = []
 
@@ -31,9 +33,9 @@ with graph.as_default():
     y_placeholder = tf.placeholder(tf.float32, (None, 10), 'y_placeholder')
     
     model = SimpleDNN()
-    logits = model(x_placeholder)
+    logits, probabilities = model(x_placeholder)
     
-    cross_entropy = tf.reduce_mean(tf.reduce_sum(-y_placeholder * utils.safe_log(logits), 1), name= 'cross_entropy')
+    cross_entropy = tf.reduce_mean(utils.softmax_cross_entropy(y_placeholder, logits), name= 'cross_entropy')
     optimizer = tf.train.AdamOptimizer(learning_rate)
     train_step = optimizer.minimize(cross_entropy, name= 'train_step')
     
@@ -41,7 +43,7 @@ with graph.as_default():
                     tf.cast(
                         tf.equal(
                             tf.arg_max(y_placeholder, dimension= 1),
-                            tf.arg_max(logits, dimension= 1)
+                            tf.arg_max(probabilities, dimension= 1)
                         ),
                         tf.float32
                     ),
@@ -56,9 +58,9 @@ with graph.as_default():
     y_placeholder = tf.placeholder(tf.float32, (None, 10), 'y_placeholder')
     
     model = SimpleDNN()
-    logits = model(x_placeholder)
+    logits, probabilities = model(x_placeholder)
     
-    cross_entropy = tf.reduce_mean(tf.reduce_sum(-y_placeholder * utils.safe_log(logits), 1), name= 'cross_entropy')
+    cross_entropy = tf.reduce_mean(utils.softmax_cross_entropy(y_placeholder, logits), name= 'cross_entropy')
     optimizer = tf.train.AdamOptimizer(learning_rate)
     train_step = optimizer.minimize(cross_entropy, name= 'train_step')
     
@@ -66,7 +68,7 @@ with graph.as_default():
                     tf.cast(
                         tf.equal(
                             tf.arg_max(y_placeholder, dimension= 1),
-                            tf.arg_max(logits, dimension= 1)
+                            tf.arg_max(probabilities, dimension= 1)
                         ),
                         tf.float32
                     ),
@@ -89,23 +91,17 @@ for graph in graphs:
         cross_entropy = graph.get_tensor_by_name('cross_entropy:0')
         train_step = graph.get_operation_by_name('train_step')
         accuracy = graph.get_tensor_by_name('accuracy:0')
+        evaluator = Evaluator(x_placeholder, y_placeholder, [accuracy],
+                              subset_size= eval_subset_size, full_every= full_eval_every)
         
         for epoch in range(1, EPOCH+1, 1):
             
-            np.random.shuffle(random_order)
-            train_x = train_x[random_order]
-            train_y = train_y[random_order]
-            
             total_loss = 0.0
-            for idx in range(train_dataset_counts//batch_size):
-                x = train_x[idx*batch_size : (idx+1)*batch_size]
-                y = train_y[idx*batch_size : (idx+1)*batch_size]       
-                
+            for x, y in utils.epoch_batches(train_x, train_y, batch_size):
                 feed_dict = {x_placeholder:x, y_placeholder:y}
                 _, loss = sess.run([train_step, cross_entropy], feed_dict= feed_dict)
                 total_loss += (loss / train_dataset_counts * batch_size)
-            feed_dict = {x_placeholder:train_x, y_placeholder:train_y}   
-            train_acc = sess.run(accuracy, feed_dict= feed_dict)
+            [train_acc] = evaluator(sess, train_x, train_y, epoch)
             print('epoch:', epoch, ',loss:', total_loss, ',train_acc:', train_acc)
 
         weights = []
@@ -115,36 +111,21 @@ for graph in graphs:
         
         batch_size = 1024
 
-alpha_records = []
-train_acc_record = []
-test_acc_record = []
-train_loss_record = []
-test_loss_record = []
-
-for alpha in range(-100, 201, 1):
-    alpha = alpha * 1e-2
-    alpha_records.append(alpha)
-    with tf.Session(graph= graph) as sess:
-        sess.run(tf.global_variables_initializer())
-        for idx, variable in enumerate(tf.trainable_variables()):
-            new_weight = alpha * weights_record[0][idx] + (1-alpha) * weights_record[1][idx]
-            assign = tf.assign(variable, new_weight)
-            sess.run(assign)
-            
-        x_placeholder = graph.get_tensor_by_name('x_placeholder:0')
-        y_placeholder = graph.get_tensor_by_name('y_placeholder:0')
-        cross_entropy = graph.get_tensor_by_name('cross_entropy:0')
-        accuracy = graph.get_tensor_by_name('accuracy:0')
-        
-        feed_dict = {x_placeholder:train_x, y_placeholder:train_y}   
-        train_acc, train_loss = sess.run([accuracy, cross_entropy], feed_dict= feed_dict)
-        train_acc_record.append(train_acc)
-        train_loss_record.append(train_loss)
-        
-        feed_dict = {x_placeholder:test_x, y_placeholder:test_y}   
-        test_acc, test_loss = sess.run([accuracy, cross_entropy], feed_dict= feed_dict)
-        test_acc_record.append(test_acc)
-        test_loss_record.append(test_loss)
+with graph.as_default():
+    x_placeholder = graph.get_tensor_by_name('x_placeholder:0')
+    y_placeholder = graph.get_tensor_by_name('y_placeholder:0')
+    cross_entropy = graph.get_tensor_by_name('cross_entropy:0')
+    accuracy = graph.get_tensor_by_name('accuracy:0')
+    interpolation = Interpolation(x_placeholder, y_placeholder, [accuracy, cross_entropy])
+
+alpha_records = [alpha * 1e-2 for alpha in range(-100, 201, 1)]
+with tf.Session(graph= graph) as sess:
+    sess.run(tf.global_variables_initializer())
+    records = interpolation.line(sess, weights_record[0], weights_record[1], alpha_records,
+                                 [(train_x, train_y), (test_x, test_y)], batch_size= batch_size)
+
+train_acc_record, train_loss_record = records[:, 0].T
+test_acc_record, test_loss_record = records[:, 1].T
 
 #%%
 import matplotlib.pyplot as plt
@@ -6,12 +6,14 @@ Created on Fri Apr  6 21:21:16 2018
 """
 
 import tensorflow as tf
-from tensorflow.examples.tutorials.mnist import input_data
+import mnist_cache
 import numpy as np
 from models import SimpleDNN
 import utils
+import sensitivity
+from evaluation import Evaluator
 
-mnist = input_data.read_data_sets('MNIST_data', one_hot= True)
+mnist = mnist_cache.load('MNIST_data')
 
 train_dataset_count = 55000
 
@@ -21,7 +23,9 @@ train_y = mnist.train.labels[0:train_dataset_count]
 test_x = mnist.test.images
 test_y = mnist.test.labels
 
-random_order = np.arange(train_dataset_count)
+sensitivity_samples = 5000
+eval_subset_size = 5000 # per epoch train accuracy on a random subset
+full_eval_every = 10 # and on the whole training set every 10 epochs
 
 #%%
 graph = tf.Graph()
@@ -30,13 +34,10 @@ with graph.as_default():
     y_placeholder = tf.placeholder(tf.float32, (None, 10), name= 'y_placeholder')
 
     model = SimpleDNN()
-    logits = model(x_placeholder)
+    logits, probabilities = model(x_placeholder)
 
     cross_entropy = tf.reduce_mean(
-                        tf.reduce_sum(
-                            -y_placeholder * utils.safe_log(logits),
-                            axis= 1
-                        ),
+                        utils.softmax_cross_entropy(y_placeholder, logits),
                     axis= 0,
                     name= 'cross_entropy'
                 )
@@ -47,7 +48,7 @@ with graph.as_default():
                 tf.cast(
                     tf.equal(
                         tf.arg_max(y_placeholder, dimension= 1),
-                        tf.arg_max(logits, dimension= 1)
+                        tf.arg_max(probabilities, dimension= 1)
                     ),
                     tf.float32
                 ),
@@ -55,6 +56,10 @@ with graph.as_default():
                 name= 'accuracy'
             )
 
+    jacobian_norm = sensitivity.jacobian_frobenius_norm(probabilities, x_placeholder)
+    evaluator = Evaluator(x_placeholder, y_placeholder, [accuracy, cross_entropy],
+                          subset_size= eval_subset_size, full_every= full_eval_every)
+
 #%%
 batch_size = 500
 EPOCH = 200
@@ -64,6 +69,7 @@ test_acc_record = []
 train_loss_record = []
 test_loss_record = []
 sensitivity_record = []
+sensitivity_percentile_record = []
 batch_size_record = []
 
 for _ in range(10): # train 10 different structure
@@ -71,27 +77,16 @@ for _ in range(10): # train 10 different structure
         sess.run(tf.global_variables_initializer())
 
         for epoch in range(1, EPOCH+1, 1):
-            np.random.shuffle(random_order)
-            train_x = train_x[random_order]
-            train_y = train_y[random_order]
-
             train_loss = 0
-            for idx in range(train_dataset_count // batch_size):
-                x = train_x[idx * batch_size : (idx + 1) * batch_size]
-                y = train_y[idx * batch_size : (idx + 1) * batch_size]
-
+            for x, y in utils.epoch_batches(train_x, train_y, batch_size):
                 feed_dict = {x_placeholder:x, y_placeholder:y}
                 _, loss = sess.run([train_step, cross_entropy], feed_dict= feed_dict)
                 train_loss += (loss * (batch_size / train_dataset_count))
-            feed_dict = {x_placeholder: train_x, y_placeholder: train_y}
-            train_acc = sess.run(accuracy, feed_dict= feed_dict)
+            train_acc, _ = evaluator(sess, train_x, train_y, epoch)
             print('epoch:', epoch, ', loss:', train_loss, ',train_acc:', train_acc)
 
-        feed_dict = {x_placeholder: train_x, y_placeholder: train_y}
-        train_acc, train_loss = sess.run([accuracy, cross_entropy], feed_dict= feed_dict)
-
-        feed_dict = {x_placeholder: test_x, y_placeholder: test_y}
-        test_acc, test_loss = sess.run([accuracy, cross_entropy], feed_dict= feed_dict)
+        train_acc, train_loss = evaluator(sess, train_x, train_y)
+        test_acc, test_loss = evaluator(sess, test_x, test_y)
 
         batch_size_record.append(batch_size)
         batch_size = batch_size + 500
@@ -100,18 +95,13 @@ for _ in range(10): # train 10 different structure
         train_loss_record.append(train_loss)
         test_loss_record.append(test_loss)
 
-        random_seed = np.random.randint(train_dataset_count, size=None)
-        jacobian_x = train_x[random_seed].reshape(1, -1)
-
-        jacobian_elements = []
-        for yi in tf.unstack(logits, axis= 1):
-            grad = sess.run(tf.gradients(yi, x_placeholder), feed_dict= {x_placeholder: jacobian_x})[0]
-            print(grad.shape)
-            jacobian_elements.append(grad)
-        jacobian_elements = np.asarray(jacobian_elements)
-        sensitivity = np.sum(jacobian_elements**2)**0.5
+        samples = np.random.choice(train_dataset_count, sensitivity_samples, replace= False)
+        norms = sensitivity.evaluate(sess, jacobian_norm, x_placeholder, train_x[samples])
+        mean_norm, percentiles = sensitivity.summarize(norms)
+        print('sensitivity:', mean_norm, ',percentiles:', percentiles)
 
-        sensitivity_record.append(sensitivity)
+        sensitivity_record.append(mean_norm)
+        sensitivity_percentile_record.append(percentiles)
 
 #%%
 import matplotlib.pyplot as plt
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import tensorflow as tf
+import numpy as np
+from evaluation import Evaluator
+
+class Interpolation:
+    # Evaluates metrics of one graph at linear combinations of weight sets.
+    # Build it inside the graph: weights are fed to a single assign op
+    # through placeholders, so sweeping alphas adds no ops and the same
+    # session is reused.
+    def __init__(self, x_placeholder, y_placeholder, metrics, var_list= None):
+        if var_list is None:
+            var_list = tf.trainable_variables()
+        self.x_placeholder = x_placeholder
+        self.y_placeholder = y_placeholder
+        self.metrics = metrics
+        self.evaluator = Evaluator(x_placeholder, y_placeholder, metrics)
+        self.var_list = var_list
+        self.weight_placeholders = [tf.placeholder(v.dtype.base_dtype, v.get_shape()) for v in var_list]
+        self.assign = tf.group(*[tf.assign(v, p) for v, p in zip(var_list, self.weight_placeholders)])
+        
+    def get_weights(self, sess):
+        return sess.run(self.var_list)
+        
+    def set_weights(self, sess, weights):
+        sess.run(self.assign, feed_dict= dict(zip(self.weight_placeholders, weights)))
+        
+    def evaluate(self, sess, x, y, batch_size= 1024):
+        # Sample weighted mean of every metric over fixed size minibatches
+        return self.evaluator.evaluate(sess, x, y, batch_size= batch_size)
+    
+    def line(self, sess, weights_a, weights_b, alphas, datasets, batch_size= 1024):
+        # alpha * weights_a + (1 - alpha) * weights_b for every alpha,
+        # returns [len(alphas), len(datasets), len(metrics)]
+        records = []
+        for alpha in alphas:
+            self.set_weights(sess, [alpha * a + (1 - alpha) * b for a, b in zip(weights_a, weights_b)])
+            records.append([self.evaluate(sess, x, y, batch_size) for x, y in datasets])
+        return np.asarray(records)
+    
+    def plane(self, sess, weights_o, weights_a, weights_b, alphas, betas, datasets, batch_size= 1024):
+        # weights_o + alpha * (weights_a - weights_o) + beta * (weights_b - weights_o),
+        # returns [len(alphas), len(betas), len(datasets), len(metrics)]
+        records = []
+        for alpha in alphas:
+            row = []
+            for beta in betas:
+                self.set_weights(sess, [o + alpha * (a - o) + beta * (b - o)
+                                        for o, a, b in zip(weights_o, weights_a, weights_b)])
+                row.append([self.evaluate(sess, x, y, batch_size) for x, y in datasets])
+            records.append(row)
+        return np.asarray(records)
@@ -6,336 +6,133 @@ Created on Wed Apr  4 16:26:27 2018
 """
 
 import tensorflow as tf
-from tensorflow.examples.tutorials.mnist import input_data
+import mnist_cache
 import utils
-from models import SimpleDNN_1, SimpleDNN_2, SimpleDNN_3, SimpleDNN_4, SimpleDNN_5, SimpleDNN_6, SimpleDNN_7, SimpleDNN_8, SimpleDNN_9, SimpleDNN_10
+from models import DNN
+from evaluation import Evaluator
 import numpy as np
+import multiprocessing
+import json
 
 train_dataset_counts = 55000
 learning_rate = 0.003
 EPOCH = 100
 batch_size = 200
-
-mnist = input_data.read_data_sets('./MNIST_data', one_hot= True)
-train_x = mnist.train.images[0:train_dataset_counts, :]
-train_y = mnist.train.labels[0:train_dataset_counts, :]
-
-test_x = mnist.test.images[0:train_dataset_counts, :]
-test_y = mnist.test.labels[0:train_dataset_counts, :]
-
-random_order = np.arange(train_dataset_counts)
-
-graphs = []
-
-graph = tf.Graph()
-with graph.as_default():
-    x_placeholder = tf.placeholder(tf.float32, (None, 784), 'x_placeholder')
-    y_placeholder = tf.placeholder(tf.float32, (None, 10), 'y_placeholder')
-    
-    model = SimpleDNN_1()
-    logits = model(x_placeholder)
-    
-    cross_entropy = tf.reduce_mean(tf.reduce_sum(-y_placeholder * utils.safe_log(logits), 1), name= 'cross_entropy')
-    optimizer = tf.train.AdamOptimizer(learning_rate)
-    train_step = optimizer.minimize(cross_entropy, name= 'train_step')
-    
-    accuracy = tf.reduce_mean(
-                    tf.cast(
-                        tf.equal(
-                            tf.arg_max(y_placeholder, dimension= 1),
-                            tf.arg_max(logits, dimension= 1)
-                        ),
-                        tf.float32
-                    ),
-                    name= 'accuracy'
-                )
-graphs.append(graph)
-
-graph = tf.Graph()
-with graph.as_default():
-    x_placeholder = tf.placeholder(tf.float32, (None, 784), 'x_placeholder')
-    y_placeholder = tf.placeholder(tf.float32, (None, 10), 'y_placeholder')
-    
-    model = SimpleDNN_2()
-    logits = model(x_placeholder)
-    
-    cross_entropy = tf.reduce_mean(tf.reduce_sum(-y_placeholder * utils.safe_log(logits), 1), name= 'cross_entropy')
-    optimizer = tf.train.AdamOptimizer(learning_rate)
-    train_step = optimizer.minimize(cross_entropy, name= 'train_step')
-    
-    accuracy = tf.reduce_mean(
-                    tf.cast(
-                        tf.equal(
-                            tf.arg_max(y_placeholder, dimension= 1),
-                            tf.arg_max(logits, dimension= 1)
-                        ),
-                        tf.float32
-                    ),
-                    name= 'accuracy'
-                )
-graphs.append(graph)
-
-graph = tf.Graph()
-with graph.as_default():
-    x_placeholder = tf.placeholder(tf.float32, (None, 784), 'x_placeholder')
-    y_placeholder = tf.placeholder(tf.float32, (None, 10), 'y_placeholder')
-    
-    model = SimpleDNN_3()
-    logits = model(x_placeholder)
-    
-    cross_entropy = tf.reduce_mean(tf.reduce_sum(-y_placeholder * utils.safe_log(logits), 1), name= 'cross_entropy')
-    optimizer = tf.train.AdamOptimizer(learning_rate)
-    train_step = optimizer.minimize(cross_entropy, name= 'train_step')
-    
-    accuracy = tf.reduce_mean(
-                    tf.cast(
-                        tf.equal(
-                            tf.arg_max(y_placeholder, dimension= 1),
-                            tf.arg_max(logits, dimension= 1)
-                        ),
-                        tf.float32
-                    ),
-                    name= 'accuracy'
-                )
-graphs.append(graph)
-
-graph = tf.Graph()
-with graph.as_default():
-    x_placeholder = tf.placeholder(tf.float32, (None, 784), 'x_placeholder')
-    y_placeholder = tf.placeholder(tf.float32, (None, 10), 'y_placeholder')
-    
-    model = SimpleDNN_4()
-    logits = model(x_placeholder)
-    
-    cross_entropy = tf.reduce_mean(tf.reduce_sum(-y_placeholder * utils.safe_log(logits), 1), name= 'cross_entropy')
-    optimizer = tf.train.AdamOptimizer(learning_rate)
-    train_step = optimizer.minimize(cross_entropy, name= 'train_step')
-    
-    accuracy = tf.reduce_mean(
-                    tf.cast(
-                        tf.equal(
-                            tf.arg_max(y_placeholder, dimension= 1),
-                            tf.arg_max(logits, dimension= 1)
-                        ),
-                        tf.float32
-                    ),
-                    name= 'accuracy'
-                )
-graphs.append(graph)
-
-graph = tf.Graph()
-with graph.as_default():
-    x_placeholder = tf.placeholder(tf.float32, (None, 784), 'x_placeholder')
-    y_placeholder = tf.placeholder(tf.float32, (None, 10), 'y_placeholder')
-    
-    model = SimpleDNN_5()
-    logits = model(x_placeholder)
-    
-    cross_entropy = tf.reduce_mean(tf.reduce_sum(-y_placeholder * utils.safe_log(logits), 1), name= 'cross_entropy')
-    optimizer = tf.train.AdamOptimizer(learning_rate)
-    train_step = optimizer.minimize(cross_entropy, name= 'train_step')
-    
-    accuracy = tf.reduce_mean(
-                    tf.cast(
-                        tf.equal(
-                            tf.arg_max(y_placeholder, dimension= 1),
-                            tf.arg_max(logits, dimension= 1)
-                        ),
-                        tf.float32
-                    ),
-                    name= 'accuracy'
-                )
-graphs.append(graph)
-
-graph = tf.Graph()
-with graph.as_default():
-    x_placeholder = tf.placeholder(tf.float32, (None, 784), 'x_placeholder')
-    y_placeholder = tf.placeholder(tf.float32, (None, 10), 'y_placeholder')
-    
-    model = SimpleDNN_6()
-    logits = model(x_placeholder)
-    
-    cross_entropy = tf.reduce_mean(tf.reduce_sum(-y_placeholder * utils.safe_log(logits), 1), name= 'cross_entropy')
-    optimizer = tf.train.AdamOptimizer(learning_rate)
-    train_step = optimizer.minimize(cross_entropy, name= 'train_step')
-    
-    accuracy = tf.reduce_mean(
-                    tf.cast(
-                        tf.equal(
-                            tf.arg_max(y_placeholder, dimension= 1),
-                            tf.arg_max(logits, dimension= 1)
-                        ),
-                        tf.float32
-                    ),
-                    name= 'accuracy'
-                )
-graphs.append(graph)
-
-graph = tf.Graph()
-with graph.as_default():
-    x_placeholder = tf.placeholder(tf.float32, (None, 784), 'x_placeholder')
-    y_placeholder = tf.placeholder(tf.float32, (None, 10), 'y_placeholder')
-    
-    model = SimpleDNN_7()
-    logits = model(x_placeholder)
-    
-    cross_entropy = tf.reduce_mean(tf.reduce_sum(-y_placeholder * utils.safe_log(logits), 1), name= 'cross_entropy')
-    optimizer = tf.train.AdamOptimizer(learning_rate)
-    train_step = optimizer.minimize(cross_entropy, name= 'train_step')
-    
-    accuracy = tf.reduce_mean(
-                    tf.cast(
-                        tf.equal(
-                            tf.arg_max(y_placeholder, dimension= 1),
-                            tf.arg_max(logits, dimension= 1)
-                        ),
-                        tf.float32
-                    ),
-                    name= 'accuracy'
-                )
-graphs.append(graph)
-
-graph = tf.Graph()
-with graph.as_default():
-    x_placeholder = tf.placeholder(tf.float32, (None, 784), 'x_placeholder')
-    y_placeholder = tf.placeholder(tf.float32, (None, 10), 'y_placeholder')
-    
-    model = SimpleDNN_8()
-    logits = model(x_placeholder)
-    
-    cross_entropy = tf.reduce_mean(tf.reduce_sum(-y_placeholder * utils.safe_log(logits), 1), name= 'cross_entropy')
-    optimizer = tf.train.AdamOptimizer(learning_rate)
-    train_step = optimizer.minimize(cross_entropy, name= 'train_step')
-    
-    accuracy = tf.reduce_mean(
-                    tf.cast(
-                        tf.equal(
-                            tf.arg_max(y_placeholder, dimension= 1),
-                            tf.arg_max(logits, dimension= 1)
-                        ),
-                        tf.float32
-                    ),
-                    name= 'accuracy'
-                )
-graphs.append(graph)
-
-graph = tf.Graph()
-with graph.as_default():
-    x_placeholder = tf.placeholder(tf.float32, (None, 784), 'x_placeholder')
-    y_placeholder = tf.placeholder(tf.float32, (None, 10), 'y_placeholder')
-    
-    model = SimpleDNN_9()
-    logits = model(x_placeholder)
-    
-    cross_entropy = tf.reduce_mean(tf.reduce_sum(-y_placeholder * utils.safe_log(logits), 1), name= 'cross_entropy')
-    optimizer = tf.train.AdamOptimizer(learning_rate)
-    train_step = optimizer.minimize(cross_entropy, name= 'train_step')
-    
-    accuracy = tf.reduce_mean(
-                    tf.cast(
-                        tf.equal(
-                            tf.arg_max(y_placeholder, dimension= 1),
-                            tf.arg_max(logits, dimension= 1)
-                        ),
-                        tf.float32
-                    ),
-                    name= 'accuracy'
-                )
-graphs.append(graph)
-
-graph = tf.Graph()
-with graph.as_default():
-    x_placeholder = tf.placeholder(tf.float32, (None, 784), 'x_placeholder')
-    y_placeholder = tf.placeholder(tf.float32, (None, 10), 'y_placeholder')
-    
-    model = SimpleDNN_10()
-    logits = model(x_placeholder)
-    
-    cross_entropy = tf.reduce_mean(tf.reduce_sum(-y_placeholder * utils.safe_log(logits), 1), name= 'cross_entropy')
-    optimizer = tf.train.AdamOptimizer(learning_rate)
-    train_step = optimizer.minimize(cross_entropy, name= 'train_step')
-    
-    accuracy = tf.reduce_mean(
-                    tf.cast(
-                        tf.equal(
-                            tf.arg_max(y_placeholder, dimension= 1),
-                            tf.arg_max(logits, dimension= 1)
+eval_subset_size = 5000 # per epoch train accuracy on a random subset
+full_eval_every = 10 # and on the whole training set every 10 epochs
+
+hidden_units_list = [5, 10, 20, 30, 40, 50, 60, 70, 80, 90]
+N_worker = 4 # models trained at the same time, one process each
+record_file = './number_of_parameters_record.txt'
+
+mnist = None
+
+def load_data():
+    # Once per worker process
+    global mnist
+    mnist = mnist_cache.load('./MNIST_data')
+
+def train_model(hidden_units, N_thread= 0):
+    train_x = mnist.train.images[0:train_dataset_counts, :]
+    train_y = mnist.train.labels[0:train_dataset_counts, :]
+
+    test_x = mnist.test.images[0:train_dataset_counts, :]
+    test_y = mnist.test.labels[0:train_dataset_counts, :]
+
+    graph = tf.Graph()
+    with graph.as_default():
+        x_placeholder = tf.placeholder(tf.float32, (None, 784), 'x_placeholder')
+        y_placeholder = tf.placeholder(tf.float32, (None, 10), 'y_placeholder')
+
+        model = DNN(hidden_units, 'DNN_%d' % hidden_units)
+        logits, probabilities = model(x_placeholder)
+
+        cross_entropy = tf.reduce_mean(utils.softmax_cross_entropy(y_placeholder, logits), name= 'cross_entropy')
+        optimizer = tf.train.AdamOptimizer(learning_rate)
+        train_step = optimizer.minimize(cross_entropy, name= 'train_step')
+
+        accuracy = tf.reduce_mean(
+                        tf.cast(
+                            tf.equal(
+                                tf.arg_max(y_placeholder, dimension= 1),
+                                tf.arg_max(probabilities, dimension= 1)
+                            ),
+                            tf.float32
                         ),
-                        tf.float32
-                    ),
-                    name= 'accuracy'
-                )
-graphs.append(graph)
+                        name= 'accuracy'
+                    )
+        evaluator = Evaluator(x_placeholder, y_placeholder, [accuracy, cross_entropy],
+                              subset_size= eval_subset_size, full_every= full_eval_every)
 
-#%%
-
-train_loss_record = []
-test_loss_record = []
-train_acc_record = []
-test_acc_record = []
-parameters_record = []
-
-for each_graph in graphs:
-    with tf.Session(graph= each_graph) as sess:
-        sess.run(tf.global_variables_initializer())
-        
         parameters = 0
         for variable in tf.trainable_variables():
             parameters += np.prod(variable.get_shape().as_list())
-        parameters_record.append(parameters)
-        
-        x_placeholder = each_graph.get_tensor_by_name('x_placeholder:0')
-        y_placeholder = each_graph.get_tensor_by_name('y_placeholder:0')
-        cross_entropy = each_graph.get_tensor_by_name('cross_entropy:0')
-        train_step = each_graph.get_operation_by_name('train_step')
-        accuracy = each_graph.get_tensor_by_name('accuracy:0')
-        
+
+    config = tf.ConfigProto(intra_op_parallelism_threads= N_thread,
+                            inter_op_parallelism_threads= N_thread)
+    with tf.Session(graph= graph, config= config) as sess:
+        sess.run(tf.global_variables_initializer())
+
         for epoch in range(1, EPOCH+1, 1):
-            
-            np.random.shuffle(random_order)
-            train_x = train_x[random_order]
-            train_y = train_y[random_order]
-            
+
             total_loss = 0.0
-            for idx in range(train_dataset_counts//batch_size):
-                x = train_x[idx*batch_size : (idx+1)*batch_size]
-                y = train_y[idx*batch_size : (idx+1)*batch_size]       
-                
+            for x, y in utils.epoch_batches(train_x, train_y, batch_size):
                 feed_dict = {x_placeholder:x, y_placeholder:y}
                 _, loss = sess.run([train_step, cross_entropy], feed_dict= feed_dict)
                 total_loss += (loss / train_dataset_counts * batch_size)
-            feed_dict = {x_placeholder:train_x, y_placeholder:train_y}   
-            train_acc = sess.run(accuracy, feed_dict= feed_dict)
-            print('epoch:', epoch, ',loss:', total_loss, ',train_acc:', train_acc)
-        
-        feed_dict = {x_placeholder:train_x, y_placeholder:train_y}   
-        train_acc, train_loss = sess.run([accuracy, cross_entropy], feed_dict= feed_dict)
-        
-        feed_dict = {x_placeholder:test_x, y_placeholder:test_y}   
-        test_acc, test_loss = sess.run([accuracy, cross_entropy], feed_dict= feed_dict)
-        
-        train_loss_record.append(train_loss)
-        test_loss_record.append(test_loss)
-        train_acc_record.append(train_acc)
-        test_acc_record.append(test_acc)
-#%%
-import matplotlib.pyplot as plt
-fig1 = plt.figure(1)
-plt.xlabel('# of Parameters')
-plt.ylabel('Loss')
-plt.title('Model Loss')
-plt.scatter(parameters_record, train_loss_record, alpha= 0.5, label="train_loss")            
-plt.scatter(parameters_record, test_loss_record, alpha= 0.5, label="test_loss")
-plt.legend(loc='upper right')      
-fig1.savefig('Model Loss.png')
-plt.close()
+            train_acc, _ = evaluator(sess, train_x, train_y, epoch)
+            print('hidden_units:', hidden_units, 'epoch:', epoch, ',loss:', total_loss, ',train_acc:', train_acc)
 
-fig2 = plt.figure(2)
-plt.xlabel('# of Parameters')
-plt.ylabel('Accuracy')
-plt.title('Model Accuracy')
-plt.scatter(parameters_record, train_acc_record, alpha= 0.5, label="train_acc")            
-plt.scatter(parameters_record, test_acc_record, alpha= 0.5, label="test_acc")
-plt.legend(loc='upper left')      
-fig2.savefig('Model Accuracy.png')
-plt.close()
\ No newline at end of file
+        train_acc, train_loss = evaluator(sess, train_x, train_y)
+        test_acc, test_loss = evaluator(sess, test_x, test_y)
+
+    return {'hidden_units': hidden_units,
+            'parameters': int(parameters),
+            'train_loss': float(train_loss),
+            'test_loss': float(test_loss),
+            'train_acc': float(train_acc),
+            'test_acc': float(test_acc)}
+
+def train_task(args):
+    return train_model(*args)
+
+#%%
+if __name__ == '__main__':
+    # Every configuration is trained in its own process with its share of
+    # the cores, results are appended to record_file as they finish
+    N_thread = max(1, multiprocessing.cpu_count() // N_worker)
+    records = []
+    with multiprocessing.get_context('spawn').Pool(N_worker, initializer= load_data) as pool, \
+         open(record_file, 'w') as f:
+        tasks = [(hidden_units, N_thread) for hidden_units in hidden_units_list]
+        for record in pool.imap_unordered(train_task, tasks):
+            f.write(json.dumps(record) + '\n')
+            f.flush()
+            records.append(record)
+
+    parameters_record = [record['parameters'] for record in records]
+    train_loss_record = [record['train_loss'] for record in records]
+    test_loss_record = [record['test_loss'] for record in records]
+    train_acc_record = [record['train_acc'] for record in records]
+    test_acc_record = [record['test_acc'] for record in records]
+
+    #%%
+    import matplotlib.pyplot as plt
+    fig1 = plt.figure(1)
+    plt.xlabel('# of Parameters')
+    plt.ylabel('Loss')
+    plt.title('Model Loss')
+    plt.scatter(parameters_record, train_loss_record, alpha= 0.5, label="train_loss")
+    plt.scatter(parameters_record, test_loss_record, alpha= 0.5, label="test_loss")
+    plt.legend(loc='upper right')
+    fig1.savefig('Model Loss.png')
+    plt.close()
+
+    fig2 = plt.figure(2)
+    plt.xlabel('# of Parameters')
+    plt.ylabel('Accuracy')
+    plt.title('Model Accuracy')
+    plt.scatter(parameters_record, train_acc_record, alpha= 0.5, label="train_acc")
+    plt.scatter(parameters_record, test_acc_record, alpha= 0.5, label="test_acc")
+    plt.legend(loc='upper left')
+    fig2.savefig('Model Accuracy.png')
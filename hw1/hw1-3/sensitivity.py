@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+import tensorflow as tf
+import numpy as np
+
+def jacobian_frobenius_norm(outputs, inputs):
+    # Per-sample ||d outputs / d inputs||_F, [batch], built once at graph
+    # construction. Samples of a batch do not interact in these models, so
+    # the gradient of a class summed over the batch is every sample's own
+    # Jacobian row: one tf.gradients per output class covers the batch.
+    squares = []
+    for k in range(outputs.get_shape().as_list()[-1]):
+        [grad] = tf.gradients(tf.reduce_sum(outputs[:, k]), inputs)
+        squares.append(tf.reduce_sum(tf.square(grad), axis= 1))
+    return tf.sqrt(tf.add_n(squares))
+
+def evaluate(sess, norm, x_placeholder, x, batch_size= 1000):
+    # Jacobian norm of every row of x, in fixed size minibatches
+    norms = []
+    for idx in range(0, len(x), batch_size):
+        norms.append(sess.run(norm, feed_dict= {x_placeholder: x[idx:idx + batch_size]}))
+    return np.concatenate(norms)
+
+def summarize(norms, percentiles= (5, 25, 50, 75, 95)):
+    # Mean and percentiles of the per-sample norms
+    return np.mean(norms), dict(zip(percentiles, np.percentile(norms, percentiles)))
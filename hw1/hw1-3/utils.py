@@ -7,9 +7,23 @@ Created on Sat Mar 24 15:58:56 2018
 """
 
 import tensorflow as tf
+import numpy as np
 
 
-def safe_log(x, eps= 1e-14):
-    return tf.log(x + eps)
+def softmax_cross_entropy(labels, logits):
+    # Per sample cross entropy over the last axis
+    return tf.nn.softmax_cross_entropy_with_logits_v2(labels= tf.stop_gradient(labels), logits= logits)
 
-    
\ No newline at end of file
+    
+
+
+def epoch_batches(x, y, batch_size, order= None):
+    # Minibatches of one epoch gathered by index, x and y stay in place.
+    # order defaults to a new permutation, its last axis indexes samples so
+    # a [K, N] order gives [K, batch_size, ...] batches for ensembles. The
+    # last partial batch is dropped.
+    if order is None:
+        order = np.random.permutation(len(x))
+    for idx in range(order.shape[-1] // batch_size):
+        batch = order[..., idx * batch_size : (idx + 1) * batch_size]
+        yield x[batch], y[batch]
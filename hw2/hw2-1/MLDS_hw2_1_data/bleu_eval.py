@@ -2,7 +2,9 @@ import math
 import operator
 import sys
 import json
+from collections import Counter
 from functools import reduce 
+import numpy as np
 def count_ngram(candidate, references, n):
     clipped_count = 0
     count = 0
@@ -101,6 +103,70 @@ def BLEU(s,t,flag = False):
     precisions.append(pr)
     score = geometric_mean(precisions) * bp
     return score
+
+
+class BLEUScorer(object):
+    """BLEU(s, t, True) for many candidates against a fixed reference set.
+
+    References are tokenized once, words are mapped to integer ids and
+    n-grams are kept as tuples of ids. Per video only the max count of
+    every n-gram over its references is stored, so clipping a candidate is
+    one Counter intersection.
+    """
+    def __init__(self, references, max_n= 1):
+        self.max_n = max_n
+        self.vocab = {}
+        self.ref_lengths = {}
+        self.ref_counts = {}
+        for vid, captions in references.items():
+            sentences = [self.tokenize(caption, True) for caption in captions]
+            self.ref_lengths[vid] = [len(words) for words in sentences]
+            self.ref_counts[vid] = []
+            for n in range(1, max_n + 1):
+                max_counts = Counter()
+                for words in sentences:
+                    max_counts |= self.ngrams(words, n)
+                self.ref_counts[vid].append(max_counts)
+
+    def tokenize(self, sentence, add= False):
+        """Lower-cased word ids, words unseen in the references are -1"""
+        if add:
+            return tuple(self.vocab.setdefault(word, len(self.vocab))
+                         for word in sentence.strip().lower().split())
+        return tuple(self.vocab.get(word, -1) for word in sentence.strip().lower().split())
+
+    @staticmethod
+    def ngrams(words, n):
+        return Counter(words[i:i + n] for i in range(len(words) - n + 1))
+
+    def statistics(self, candidates):
+        """Clipped counts, n-gram counts, candidate and best reference lengths"""
+        clipped = np.zeros((len(candidates), self.max_n))
+        count = np.zeros((len(candidates), self.max_n))
+        c = np.zeros(len(candidates))
+        r = np.zeros(len(candidates))
+        for idx, (vid, sentence) in enumerate(candidates):
+            words = self.tokenize(sentence)
+            for n in range(1, self.max_n + 1):
+                clipped[idx, n - 1] = sum((self.ngrams(words, n) & self.ref_counts[vid][n - 1]).values())
+                count[idx, n - 1] = len(words) - n + 1
+            c[idx] = len(words)
+            r[idx] = best_length_match(self.ref_lengths[vid], len(words))
+        return clipped, count, c, r
+
+    def sentence_scores(self, candidates):
+        """BLEU of every (video id, caption) pair, same as BLEU(s, t, True)"""
+        clipped, count, c, r = self.statistics(candidates)
+        with np.errstate(divide= 'ignore', invalid= 'ignore'):
+            precisions = np.where(clipped == 0, 0., clipped / count)
+            bp = np.where(c > r, 1., np.exp(1 - r / c))
+        return np.prod(precisions, axis= 1) ** (1.0 / self.max_n) * bp
+
+    def score(self, result):
+        """Average BLEU of a {video id: caption} result over all references"""
+        return np.mean(self.sentence_scores([(vid, result[vid]) for vid in self.ref_counts]))
+
+
 ### Usage: python bleu_eval.py caption.txt
 ### Ref : https://github.com/vikasnar/Bleu
 if __name__ == "__main__" :
@@ -115,13 +181,8 @@ if __name__ == "__main__" :
             caption = line[comma+1:]
             result[test_id] = caption
     #count by the method described in the paper https://aclanthology.info/pdf/P/P02/P02-1040.pdf
-    bleu=[]
-    for item in test:
-        score_per_video = []
-        captions = [x.rstrip('.') for x in item['caption']]
-        score_per_video.append(BLEU(result[item['id']],captions,True))
-        bleu.append(score_per_video[0])
-    average = sum(bleu) / len(bleu)
+    scorer = BLEUScorer({item['id']: [x.rstrip('.') for x in item['caption']] for item in test})
+    average = scorer.score(result)
     print("Average bleu score is " + str(average))
 
 
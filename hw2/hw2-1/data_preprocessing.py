@@ -10,6 +10,7 @@ import re
 from collections import Counter
 import json
 import argparse
+import os
 import numpy as np
 
 def build_counter(train_label_path):
@@ -102,7 +103,68 @@ def read_train(filename):
         data = []
 
     return data
-            
+
+def flatten_label(label_data):
+    # Translated captions as flat int32 tokens, sentence i being
+    # tokens[offsets[i]:offsets[i + 1]] of video ID[video[i]]
+    ID = [captions['id'] for captions in label_data]
+    sentences = [sentence for captions in label_data for sentence in captions['caption']]
+    video = np.repeat(np.arange(len(ID), dtype= np.int32),
+                      [len(captions['caption']) for captions in label_data])
+    offsets = np.zeros(len(sentences) + 1, dtype= np.int64)
+    np.cumsum([len(sentence) for sentence in sentences], out= offsets[1:])
+    tokens = np.fromiter((word for sentence in sentences for word in sentence),
+                         dtype= np.int32, count= offsets[-1])
+    return tokens, offsets, video, ID
+
+def pack_label(label_data, packed_file):
+    tokens, offsets, video, ID = flatten_label(label_data)
+    np.save(packed_file + '_token.npy', tokens)
+    np.save(packed_file + '_sentence.npy', offsets)
+    np.save(packed_file + '_video.npy', video)
+    with open(packed_file + '_id.txt', 'w') as f:
+        for id in ID:
+            f.write(id + '\n')
+
+def read_packed(packed_file):
+    # Memory-mapped (tokens, offsets, video, ID) written by pack_label
+    tokens = np.load(packed_file + '_token.npy', mmap_mode= 'r')
+    offsets = np.load(packed_file + '_sentence.npy', mmap_mode= 'r')
+    video = np.load(packed_file + '_video.npy', mmap_mode= 'r')
+    with open(packed_file + '_id.txt', 'r') as f:
+        ID = [line.rstrip('\n') for line in f]
+    return tokens, offsets, video, ID
+
+def pack_feat(data_path, ID, feat_file):
+    # Consolidate every <id>.npy into one contiguous array, row i is ID[i].
+    # Both files are written under temporary names and renamed, the id file
+    # first, so a reader that sees feat_file never gets a partial one
+    temp_file = '%s.%d.tmp' % (feat_file, os.getpid())
+    x = np.load(data_path + '/' + ID[0] + '.npy')
+    feat = np.lib.format.open_memmap(temp_file, mode= 'w+', dtype= np.float32,
+                                     shape= (len(ID),) + x.shape)
+    for idx, id in enumerate(ID):
+        feat[idx] = np.load(data_path + '/' + id + '.npy')
+    feat.flush()
+    del feat
+
+    temp_id_file = '%s.%d.tmp' % (feat_id_file(feat_file), os.getpid())
+    with open(temp_id_file, 'w') as f:
+        for id in ID:
+            f.write(id + '\n')
+    os.replace(temp_id_file, feat_id_file(feat_file))
+    os.replace(temp_file, feat_file)
+
+def read_feat(feat_file):
+    feat = np.load(feat_file, mmap_mode= 'r')
+    feat_index = {}
+    with open(feat_id_file(feat_file), 'r') as f:
+        for idx, line in enumerate(f):
+            feat_index[line.rstrip('\n')] = idx
+    return feat, feat_index
+
+def feat_id_file(feat_file):
+    return os.path.splitext(feat_file)[0] + '_id.txt'
             
     
 def main():
@@ -121,7 +183,8 @@ def main():
     counter = denoise(counter, word_frequency= 3)
     counter.update(['<EOS>', '<BOS>', '<UNK>'])
     dictionary = build_dict(counter, args.dictionary_path)
-    translate_label(dictionary, args.train_label_path, 'translated_training_label.json')
+    label_data = translate_label(dictionary, args.train_label_path)
+    pack_label(label_data, 'translated_training_label')
 
 if __name__ == '__main__':
     main()    
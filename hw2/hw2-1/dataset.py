@@ -7,30 +7,39 @@ Created on Sun Apr 15 12:13:17 2018
 """
 
 import numpy as np
+import queue
+import threading
+import data_preprocessing as DP
 
 class DataSet:
-    def __init__(self, data_path, captions, vocab_size, BOS_tag, EOS_tag):
-        self._feat = []
-        self._label = []
-        self._caption = []
-        self._max_seq_len = 0
+    def __init__(self, data_path, captions, vocab_size, BOS_tag, EOS_tag, feat_file= None, packed_file= None):
+        self._EOS_tag = EOS_tag
         
-        for idx, caption in enumerate(captions):
-            x = np.load(data_path + '/' + caption['id'] + '.npy')
-            self._feat.append(x)
-            
-            for sentence in caption['caption']:
-                self._label.append(idx)
-                sentence.append(EOS_tag)
-                sentence = [BOS_tag] + sentence
-                self._caption.append(sentence)
-                if self._max_seq_len < len(sentence):
-                    self._max_seq_len = len(sentence)
+        if packed_file is not None:
+            # Memory-mapped tokens written by DP.pack_label, captions is unused
+            tokens, offsets, video, ID = DP.read_packed(packed_file)
+        else:
+            tokens, offsets, video, ID = DP.flatten_label(captions)
+        
+        if feat_file is not None:
+            # Rows are read from the memmap only when a batch asks for them
+            self._feat, feat_index = DP.read_feat(feat_file)
+            video_row = np.asarray([feat_index[id] for id in ID])
+        else:
+            self._feat = np.asarray([np.load(data_path + '/' + id + '.npy') for id in ID])
+            video_row = np.arange(len(ID))
+        self._label = video_row[video]
         
-        self._feat = np.asarray(self._feat)
-        self._label = np.asarray(self._label)
-        self._caption = np.asarray(self._caption)
-        self._datalen = len(self._caption)
+        # <BOS> caption <EOS> padded with EOS_tag, gathered in one go from
+        # the flat tokens
+        self._caption_len = (np.diff(offsets) + 2).astype(np.int32)
+        self._max_seq_len = int(np.amax(self._caption_len))
+        position = np.arange(self._max_seq_len)
+        is_word = (position > 0) & (position < self._caption_len[:, None] - 1)
+        word_idx = np.where(is_word, offsets[:-1, None] + position - 1, 0)
+        self._caption_matrix = np.where(is_word, tokens[word_idx], EOS_tag).astype(np.int32)
+        self._caption_matrix[:, 0] = BOS_tag
+        self._datalen = len(self._caption_matrix)
         self._feat_timestep = len(self._feat[0]) #80
         self._feat_dim = len(self._feat[0][0]) #4096
         self._vocab_size = vocab_size
@@ -49,17 +58,45 @@ class DataSet:
                 
                 self._index_in_epoch = 0
                 self._N_epoch += 1
-            x.append(self._feat[self._label[self._index_in_epoch]])
-            y.append(self._caption[self._index_in_epoch])
+            x.append(self._label[self._index_in_epoch])
+            y.append(self._caption_matrix[self._index_in_epoch, :self._caption_len[self._index_in_epoch]])
             self._index_in_epoch += 1
         
-        return np.asarray(x), np.asarray(y)
+        return self._feat[np.asarray(x)], y
+    
+    def next_padded_batch(self, batch_size = 1):
+        # Same order and epoch wraparound as next_batch, but served as whole
+        # slices of the pre-padded caption matrix
+        label = []
+        caption = []
+        caption_len = []
+        
+        while batch_size > 0:
+            if self._index_in_epoch >= self._datalen:
+                self.shuffle_data()
+                
+                self._index_in_epoch = 0
+                self._N_epoch += 1
+            end = min(self._index_in_epoch + batch_size, self._datalen)
+            label.append(self._label[self._index_in_epoch:end])
+            caption.append(self._caption_matrix[self._index_in_epoch:end])
+            caption_len.append(self._caption_len[self._index_in_epoch:end])
+            batch_size -= end - self._index_in_epoch
+            self._index_in_epoch = end
+        
+        label = np.concatenate(label)
+        y = np.concatenate(caption)
+        y_len = np.concatenate(caption_len)
+        y_mask = (np.arange(self._max_seq_len - 1) < y_len[:, None]).astype(np.float32)
+        
+        return self._feat[label], y[:, :-1], y[:, 1:], y_mask
     
     def shuffle_data(self):
         random_order = np.arange(self._datalen)
         np.random.shuffle(random_order)
         self._label = self._label[random_order]
-        self._caption = self._caption[random_order]
+        self._caption_len = self._caption_len[random_order]
+        self._caption_matrix = self._caption_matrix[random_order]
     
     @property
     def feat(self):
@@ -71,7 +108,15 @@ class DataSet:
 
     @property
     def caption(self):
-        return self._caption
+        return [sentence[:length] for sentence, length in zip(self._caption_matrix, self._caption_len)]
+
+    @property
+    def caption_matrix(self):
+        return self._caption_matrix
+
+    @property
+    def caption_len(self):
+        return self._caption_len
 
     @property
     def max_seq_len(self):
@@ -100,4 +145,47 @@ class DataSet:
     @property
     def N_epoch(self):
         return self._N_epoch
-            
\ No newline at end of file
+
+
+class BatchPrefetcher:
+    # Calls batch_fn on a worker thread and keeps up to capacity batches
+    # queued, so host-side batch preparation overlaps with sess.run. The
+    # DataSet is only touched by the worker, which keeps its shuffle/epoch
+    # order unchanged.
+    def __init__(self, batch_fn, capacity= 8):
+        self._batch_fn = batch_fn
+        self._queue = queue.Queue(maxsize= capacity)
+        self._stop = threading.Event()
+        self._error = None
+        self._thread = threading.Thread(target= self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout= 0.1)
+                return
+            except queue.Full:
+                continue
+        
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                self._put(self._batch_fn())
+        except Exception as e:
+            # Kept, so every later next_batch raises it instead of blocking
+            self._error = e
+            self._put(e)
+            
+    def next_batch(self):
+        if self._error is not None and self._queue.empty():
+            raise self._error
+        batch = self._queue.get()
+        if isinstance(batch, Exception):
+            raise batch
+        return batch
+    
+    def close(self):
+        self._stop.set()
+        self._thread.join()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Scores many checkpoints of s2s / s2s_attention on the testing set.
+
+Usage: python evaluate_checkpoints.py --model s2s_attention --steps 1000:5000:20 --workers 4
+
+Without --steps only the checkpoints still listed in the checkpoint file
+are scored, params['max_to_keep'] of them (5 by default), raise it in the
+driver before training to keep more.
+"""
+
+import tensorflow as tf
+import multiprocessing
+import importlib
+import argparse
+import json
+import os
+from MLDS_hw2_1_data.bleu_eval import BLEUScorer
+
+test_label_file = './MLDS_hw2_1_data/testing_label.json'
+
+scorer = None
+
+def init_worker():
+    # One scorer per worker process, the references are tokenized once
+    global scorer
+    with open(test_label_file, 'r') as f:
+        test = json.load(f)
+    scorer = BLEUScorer({item['id']: [x.rstrip('.') for x in item['caption']] for item in test})
+
+def evaluate_step(args):
+    # Batched captioning of the testing set with the checkpoint of one step
+    # in its own graph and session
+    model, step, beam_width, N_thread = args
+    driver = importlib.import_module(model)
+    config = tf.ConfigProto(intra_op_parallelism_threads= N_thread,
+                            inter_op_parallelism_threads= N_thread)
+    try:
+        result = driver.run_test(False, beam_width, step, config)
+    except (ValueError, tf.errors.NotFoundError) as e:
+        # Missing or unreadable checkpoint, the other steps go on
+        print('Skip step %d: %s' % (step, e))
+        return step, None
+    result = {caption['id']: ' '.join(caption['caption']) for caption in result}
+    return step, scorer.score(result)
+
+def saved_steps(model_file):
+    # Steps of all checkpoints still listed in the checkpoint file
+    checkpoint = tf.train.get_checkpoint_state(os.path.dirname(model_file))
+    if checkpoint is None:
+        return []
+    return sorted(int(path.split("-")[-1]) for path in checkpoint.all_model_checkpoint_paths)
+
+def parse_steps(steps):
+    # '100,200,300' or 'start:stop:step' with stop included
+    if ':' in steps:
+        start, stop, step = [int(x) for x in steps.split(':')]
+        return list(range(start, stop + 1, step))
+    return [int(x) for x in steps.split(',')]
+
+def main():
+    parser = argparse.ArgumentParser(description= 'BLEU of many checkpoints')
+    parser.add_argument('--model',
+                        type= str,
+                        default= 's2s_attention',
+                        choices= ['s2s', 's2s_attention'],
+                        help= 'model script')
+    parser.add_argument('--steps',
+                        type= str,
+                        default= None,
+                        help= 'checkpoint steps, "100,200" or "start:stop:step", default all saved ones')
+    parser.add_argument('--workers',
+                        type= int,
+                        default= 2,
+                        help= 'evaluation processes')
+    parser.add_argument('--beam_width',
+                        type= int,
+                        default= 1,
+                        help= 'beam search width, 1 for greedy')
+    args = parser.parse_args()
+
+    driver = importlib.import_module(args.model)
+    if args.steps is None:
+        steps = saved_steps(driver.model_file)
+    else:
+        steps = parse_steps(args.steps)
+    # Packed once here, workers only read it
+    driver.pack_test_feat()
+    N_thread = max(1, multiprocessing.cpu_count() // args.workers)
+
+    # spawn: every worker gets a fresh TensorFlow runtime
+    pool = multiprocessing.get_context('spawn').Pool(args.workers, initializer= init_worker)
+    tasks = [(args.model, step, args.beam_width, N_thread) for step in steps]
+    bleu = dict(pool.imap_unordered(evaluate_step, tasks))
+    pool.close()
+    pool.join()
+
+    print('%10s %10s' % ('step', 'BLEU'))
+    for step in steps:
+        if bleu[step] is None:
+            print('%10d %10s' % (step, 'missing'))
+        else:
+            print('%10d %10.4f' % (step, bleu[step]))
+    bleu = {step: score for step, score in bleu.items() if score is not None}
+    if bleu:
+        best = max(bleu, key= bleu.get)
+        print('Best step %d, BLEU %f' % (best, bleu[best]))
+
+if __name__ == '__main__':
+    main()
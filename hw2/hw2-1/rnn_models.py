@@ -16,6 +16,8 @@ class RnnModel:
         self.learning_rate = params['learning_rate']
         self.hidden_layers = params['hidden_layers']
         self.dropout = params['dropout']
+        self.num_sampled = params.get('num_sampled', 0) # 0: full softmax loss
+        self.max_to_keep = params.get('max_to_keep', 5) # checkpoints kept by save_model
 
 
         if self.cell_type == 'rnn':
@@ -88,15 +90,10 @@ class RnnModel:
         with tf.variable_scope('decoder', reuse= tf.get_variable_scope().reuse):     
             decoder_output, _ = tf.nn.dynamic_rnn(self.decoder_multi_cells, decoder_input_embeded, initial_state= state)
                         
-        # Project N_hidden into vocab_size
-        decoder_output_flatten = tf.reshape(decoder_output, (-1, self.N_hidden))
-        decoder_logits = tf.matmul(decoder_output_flatten, self.word_weight) + self.word_bias
-        decoder_logits = tf.reshape(decoder_logits, (self.batch_size, -1, self.vocab_size))
-
         # Loss
-        stepwise_cross_entropy = tf.nn.softmax_cross_entropy_with_logits(
-                labels= tf.one_hot(decoder_target, depth= self.vocab_size, dtype=tf.float32),
-                logits= decoder_logits)
+        decoder_output_flatten = tf.reshape(decoder_output, (-1, self.N_hidden))
+        stepwise_cross_entropy = sequence_loss(decoder_output_flatten, decoder_target,
+                                               self.word_weight, self.word_bias, self.num_sampled)
         
         loss = tf.reduce_mean(tf.reduce_sum(stepwise_cross_entropy, axis= 1))
         optimizer = tf.train.AdamOptimizer(learning_rate= self.learning_rate)
@@ -107,62 +104,65 @@ class RnnModel:
         return video, decoder_input, decoder_target, loss, train_step
  
     
-    def build_test_model(self, sampling= False):
+    def decode_step(self, word, state):
+        # One decoder step on a [batch] vector of words, same variables as
+        # the dynamic_rnn decoder
+        word_embeded = tf.nn.embedding_lookup(self.word_emdeded, word)
+        with tf.variable_scope('decoder', reuse= tf.get_variable_scope().reuse):
+            with tf.variable_scope('rnn'):
+                decoder_output, state = self.decoder_multi_cells(word_embeded, state)
+        decoder_logits = tf.matmul(decoder_output, self.word_weight) + self.word_bias
+        return decoder_logits, state
+
+
+    def build_search_model(self, search):
         # Inputs
         video = tf.placeholder(dtype=tf.float32,
-                shape=[self.batch_size, self.N_video_step, self.image_dim])
-
-        decoder_input = tf.placeholder(dtype=tf.int32,
-                shape=[self.batch_size, None])
+                shape=[None, self.N_video_step, self.image_dim])
+        batch_size = tf.shape(video)[0]
 
         # Embeded image_feat size to N_hidden
         video_flatten = tf.reshape(video, (-1, self.image_dim))
         image_embeded = tf.matmul(video_flatten, self.image_weight) + self.image_bias
         image_embeded = tf.reshape(image_embeded, (-1, self.N_video_step, self.N_hidden))
 
-        # RNN parameters
-        state = self.encoder_multi_cells.zero_state(self.batch_size, dtype= tf.float32)
-        captions = []
-        
         # Encoding Stage
+        state = self.encoder_multi_cells.zero_state(batch_size, dtype= tf.float32)
         with tf.variable_scope('encoder', reuse= tf.get_variable_scope().reuse):
-            encoder_outputs, state = tf.nn.dynamic_rnn(self.encoder_multi_cells, image_embeded, initial_state= state)
+            _, state = tf.nn.dynamic_rnn(self.encoder_multi_cells, image_embeded, initial_state= state)
 
         # Decoding Stage
-        decoder_input_embeded = tf.nn.embedding_lookup(self.word_emdeded, decoder_input)
-        for idx in range(self.N_caption_step):
-            with tf.variable_scope('decoder', reuse= tf.get_variable_scope().reuse):     
-                decoder_output, state = tf.nn.dynamic_rnn(self.decoder_multi_cells, decoder_input_embeded, initial_state= state)
-                            
-            # Project N_hidden into vocab_size
-            decoder_output_flatten = tf.reshape(decoder_output, (-1, self.N_hidden))
-            decoder_logits = tf.matmul(decoder_output_flatten, self.word_weight) + self.word_bias
-            decoder_logits = tf.reshape(decoder_logits, (self.batch_size, self.vocab_size))
-            
-            probs = tf.nn.softmax(decoder_logits)
-            if sampling:
-                best_choice = tf.multinomial(tf.log(probs), 1)
-            else:
-                best_choice = tf.expand_dims(tf.argmax(decoder_logits, axis= 1), axis= -1)
-            best_choice = tf.cast(best_choice, dtype= tf.int32)
-            
-            decoder_input_embeded = tf.nn.embedding_lookup(self.word_emdeded, best_choice)
-            captions.append(best_choice)
-            
-        captions = tf.squeeze(tf.stack(captions, axis= 1))
-        return video, decoder_input, captions
+        captions, lengths = search(self.decode_step, state, batch_size)
+        return video, captions, lengths
+
+
+    def build_greedy_search_model(self, BOS_tag, EOS_tag, sampling= False):
+        return self.build_search_model(
+                lambda step_fn, state, batch_size: greedy_search(
+                        step_fn, state, batch_size, BOS_tag, EOS_tag, self.N_caption_step, sampling))
+
+
+    def build_beam_search_model(self, BOS_tag, EOS_tag, beam_width= 5, length_penalty= 0.6):
+        return self.build_search_model(
+                lambda step_fn, state, batch_size: beam_search(
+                        step_fn, state, batch_size, BOS_tag, EOS_tag,
+                        self.vocab_size, self.N_caption_step, beam_width, length_penalty))
     
 
     def save_model(self, sess, model_file, step):
         if self.saver is None:
-            self.saver = tf.train.Saver(max_to_keep= 5)
+            self.saver = tf.train.Saver(max_to_keep= self.max_to_keep)
         if not os.path.isdir(os.path.dirname(model_file)):
             os.mkdir(os.path.dirname(model_file))
         self.saver.save(sess, model_file, global_step= step)
 
-    def restore_model(self, sess, model_file):
+    def restore_model(self, sess, model_file, step= None):
+        # Latest checkpoint of the directory, or model_file-<step> if given
         if self.saver is None:
-            self.saver = tf.train.Saver(max_to_keep= 5)
+            self.saver = tf.train.Saver(max_to_keep= self.max_to_keep)
+        if step is not None:
+            self.saver.restore(sess, '%s-%d' % (model_file, step))
+            return step
         step = 0
         checkpoint_dir = os.path.dirname(model_file)
         if os.path.isdir(checkpoint_dir):
@@ -172,6 +172,27 @@ class RnnModel:
         return step
 
 #%%
+def sequence_loss(outputs, targets, word_weight, word_bias, num_sampled= 0):
+    # Per-step cross entropy of the [batch * step, N_hidden] outputs against
+    # [batch, step] integer targets. Sparse labels avoid the one-hot tensor;
+    # with num_sampled > 0 the loss only projects onto the target and
+    # num_sampled sampled words instead of the whole vocabulary.
+    labels = tf.reshape(targets, [-1])
+    if num_sampled > 0:
+        cross_entropy = tf.nn.sampled_softmax_loss(
+                weights= tf.transpose(word_weight),
+                biases= word_bias,
+                labels= tf.expand_dims(tf.cast(labels, tf.int64), -1),
+                inputs= outputs,
+                num_sampled= num_sampled,
+                num_classes= word_weight.get_shape().as_list()[1])
+    else:
+        logits = tf.matmul(outputs, word_weight) + word_bias
+        cross_entropy = tf.nn.sparse_softmax_cross_entropy_with_logits(
+                labels= labels, logits= logits)
+    return tf.reshape(cross_entropy, tf.shape(targets))
+
+
 
 class RnnModel_Attention:
     def __init__(self, is_training, image_dim, vocab_size, N_hidden, N_video_step, N_caption_step, **params):
@@ -188,6 +209,8 @@ class RnnModel_Attention:
         self.learning_rate = params['learning_rate']
         self.hidden_layers = params['hidden_layers']
         self.dropout = params['dropout']
+        self.num_sampled = params.get('num_sampled', 0) # 0: full softmax loss
+        self.max_to_keep = params.get('max_to_keep', 5) # checkpoints kept by save_model
 
 
         if self.cell_type == 'rnn':
@@ -246,9 +269,14 @@ class RnnModel_Attention:
         
     
     def attention(self, image_states, key):
+        # Batch size of the graph being built, dynamic for the test graph
+        batch_size = image_states.get_shape().as_list()[2]
+        if batch_size is None:
+            batch_size = tf.shape(image_states)[2]
+        
         key_flatten = tf.reshape(tf.squeeze(tf.stack(key)), (-1, self.N_hidden))
         key_scores = tf.matmul(key_flatten, self.key_weight) + self.key_bias
-        key_scores = tf.reshape(key_scores, (2, self.batch_size, self.N_hidden))
+        key_scores = tf.reshape(key_scores, (2, batch_size, self.N_hidden))
         
         image_states = tf.add(tf.transpose(image_states, [1, 0, 2, 3]), key_scores)
         image_states = tf.transpose(image_states, [1, 0, 2, 3])
@@ -256,16 +284,31 @@ class RnnModel_Attention:
         
         scores = tf.matmul(image_states_flatten, self.states_weight) + self.states_bias
         scores = tf.reshape(scores,
-                    shape= (2, -1, self.batch_size, 1))
+                    shape= (2, -1, batch_size, 1))
         scores = tf.nn.softmax(tf.transpose(scores, [0, 2, 1, 3]), 2)
         scores = tf.transpose(scores, [0, 2, 1, 3])
         
         weighted_states = tf.multiply(image_states_flatten, tf.reshape(scores, (-1, 1)))
-        weighted_states = tf.reshape(weighted_states, (2, -1, self.batch_size, self.N_hidden))
+        weighted_states = tf.reshape(weighted_states, (2, -1, batch_size, self.N_hidden))
         weighted_states = tf.reduce_sum(tf.transpose(weighted_states,[0, 2, 1, 3]), 2)
         
         return (tf.contrib.rnn.LSTMStateTuple(c= weighted_states[0], h= weighted_states[1]),)
     
+    def encode(self, image_embeded, batch_size):
+        # One tf.scan over the video steps instead of a dynamic_rnn per frame.
+        # Variables live under the same encoder/rnn scope dynamic_rnn used.
+        state = self.encoder_multi_cells.zero_state(batch_size, dtype= tf.float32)
+        with tf.variable_scope('encoder', reuse= tf.get_variable_scope().reuse):
+            with tf.variable_scope('rnn'):
+                states = tf.scan(lambda state, embeded: self.encoder_multi_cells(embeded, state)[1],
+                                 tf.transpose(image_embeded, [1, 0, 2]),
+                                 initializer= state)
+        
+        # First layer (c, h) of every step: [2, N_video_step, batch_size, N_hidden]
+        image_states = tf.stack(states[0])
+        state = tf.contrib.framework.nest.map_structure(lambda s: s[-1], states)
+        return image_states, state
+
 
     def build_train_model(self):
         # Inputs
@@ -283,17 +326,8 @@ class RnnModel_Attention:
         image_embeded = tf.matmul(video_flatten, self.image_weight) + self.image_bias
         image_embeded = tf.reshape(image_embeded, (-1, self.N_video_step, self.N_hidden))
 
-        # LSTM parameters
-        state = self.encoder_multi_cells.zero_state(self.batch_size, dtype= tf.float32)
-
         # Encoding Stage
-        with tf.variable_scope('encoder', reuse= tf.get_variable_scope().reuse):
-          image_states = []
-          for idx in range(self.N_video_step):
-            embeded = tf.expand_dims(image_embeded[:,idx,:], 1)
-            _, state = tf.nn.dynamic_rnn(self.encoder_multi_cells, embeded, initial_state= state)
-            image_states.append(state[0])
-          image_states = tf.stack(image_states, 1)
+        image_states, state = self.encode(image_embeded, self.batch_size)
 
         # Decoding Stage
         decoder_input_embeded = tf.nn.embedding_lookup(self.word_emdeded, decoder_input)
@@ -305,16 +339,11 @@ class RnnModel_Attention:
               output, state = tf.nn.dynamic_rnn(self.decoder_multi_cells, embeded, initial_state= state)
               decoder_outputs.append(output)
                         
-        # Project N_hidden into vocab_size
+        # Loss
         decoder_outputs = tf.squeeze(tf.stack(decoder_outputs, 1))
         decoder_output_flatten = tf.reshape(decoder_outputs, (-1, self.N_hidden))
-        decoder_logits = tf.matmul(decoder_output_flatten, self.word_weight) + self.word_bias
-        decoder_logits = tf.reshape(decoder_logits, (self.batch_size, -1, self.vocab_size))
-
-        # Loss
-        stepwise_cross_entropy = tf.nn.softmax_cross_entropy_with_logits(
-                labels= tf.one_hot(decoder_target, depth= self.vocab_size, dtype=tf.float32),
-                logits= decoder_logits)
+        stepwise_cross_entropy = sequence_loss(decoder_output_flatten, decoder_target,
+                                               self.word_weight, self.word_bias, self.num_sampled)
         stepwise_cross_entropy = tf.multiply(stepwise_cross_entropy, decoder_mask)
         
         loss = tf.reduce_mean(tf.reduce_sum(stepwise_cross_entropy, axis= 1))
@@ -326,72 +355,188 @@ class RnnModel_Attention:
         return video, decoder_input, decoder_target, decoder_mask, loss, train_step
  
     
-    def build_test_model(self, sampling= False):
+    def decode_step(self, word, state, image_states):
+        # One attention + decoder step on a [batch] vector of words, same
+        # variables as the dynamic_rnn decoder
+        state = self.attention(image_states, state[0])
+        word_embeded = tf.nn.embedding_lookup(self.word_emdeded, word)
+        with tf.variable_scope('decoder', reuse= tf.get_variable_scope().reuse):
+            with tf.variable_scope('rnn'):
+                decoder_output, state = self.decoder_multi_cells(word_embeded, state)
+        decoder_logits = tf.matmul(decoder_output, self.word_weight) + self.word_bias
+        return decoder_logits, state
+
+
+    def build_search_model(self, search, beam_width= 1):
         # Inputs
         video = tf.placeholder(dtype=tf.float32,
-                shape=[self.batch_size, self.N_video_step, self.image_dim])
-
-        decoder_input = tf.placeholder(dtype=tf.int32,
-                shape=[self.batch_size, None])
+                shape=[None, self.N_video_step, self.image_dim])
+        batch_size = tf.shape(video)[0]
 
         # Embeded image_feat size to N_hidden
         video_flatten = tf.reshape(video, (-1, self.image_dim))
         image_embeded = tf.matmul(video_flatten, self.image_weight) + self.image_bias
         image_embeded = tf.reshape(image_embeded, (-1, self.N_video_step, self.N_hidden))
 
-        # RNN parameters
-        state = self.encoder_multi_cells.zero_state(self.batch_size, dtype= tf.float32)
-        captions = []
-        
         # Encoding Stage
-        with tf.variable_scope('encoder', reuse= tf.get_variable_scope().reuse):
-          image_states = []
-          for idx in range(self.N_video_step):
-            embeded = tf.expand_dims(image_embeded[:,idx,:], 1)
-            _, state = tf.nn.dynamic_rnn(self.encoder_multi_cells, embeded, initial_state= state)
-            image_states.append(state[0])
-          image_states = tf.stack(image_states, 1)
+        image_states, state = self.encode(image_embeded, batch_size)
+        if beam_width > 1:
+            image_states = tile_beam(image_states, beam_width, axis= 2)
 
         # Decoding Stage
-        decoder_input_embeded = tf.nn.embedding_lookup(self.word_emdeded, decoder_input)
-        with tf.variable_scope('decoder', reuse= tf.get_variable_scope().reuse):   
-          for idx in range(self.N_caption_step):
-              state = self.attention(image_states, state[0])
-              decoder_output, state = tf.nn.dynamic_rnn(self.decoder_multi_cells, decoder_input_embeded, initial_state= state)
-                            
-              # Project N_hidden into vocab_size
-              decoder_output_flatten = tf.reshape(decoder_output, (-1, self.N_hidden))
-              decoder_logits = tf.matmul(decoder_output_flatten, self.word_weight) + self.word_bias
-              decoder_logits = tf.reshape(decoder_logits, (self.batch_size, self.vocab_size))
-              
-              probs = tf.nn.softmax(decoder_logits)
-              if sampling:
-                  best_choice = tf.multinomial(tf.log(probs), 1)
-              else:
-                  best_choice = tf.expand_dims(tf.argmax(decoder_logits, axis= 1), axis= -1)
-              best_choice = tf.cast(best_choice, dtype= tf.int32)
-              captions.append(best_choice)
-              
-              decoder_input_embeded = tf.nn.embedding_lookup(self.word_emdeded, best_choice)
-
-        captions = tf.squeeze(tf.stack(captions, axis= 1))
-        return video, decoder_input, captions
+        step_fn = lambda word, state: self.decode_step(word, state, image_states)
+        captions, lengths = search(step_fn, state, batch_size)
+        return video, captions, lengths
+
+
+    def build_greedy_search_model(self, BOS_tag, EOS_tag, sampling= False):
+        return self.build_search_model(
+                lambda step_fn, state, batch_size: greedy_search(
+                        step_fn, state, batch_size, BOS_tag, EOS_tag, self.N_caption_step, sampling))
+
+
+    def build_beam_search_model(self, BOS_tag, EOS_tag, beam_width= 5, length_penalty= 0.6):
+        return self.build_search_model(
+                lambda step_fn, state, batch_size: beam_search(
+                        step_fn, state, batch_size, BOS_tag, EOS_tag,
+                        self.vocab_size, self.N_caption_step, beam_width, length_penalty),
+                beam_width)
     
 
     def save_model(self, sess, model_file, step):
         if self.saver is None:
-            self.saver = tf.train.Saver(max_to_keep= 5)
+            self.saver = tf.train.Saver(max_to_keep= self.max_to_keep)
         if not os.path.isdir(os.path.dirname(model_file)):
             os.mkdir(os.path.dirname(model_file))
         self.saver.save(sess, model_file, global_step= step)
 
-    def restore_model(self, sess, model_file):
+    def restore_model(self, sess, model_file, step= None):
+        # Latest checkpoint of the directory, or model_file-<step> if given
         if self.saver is None:
-            self.saver = tf.train.Saver(max_to_keep= 5)
+            self.saver = tf.train.Saver(max_to_keep= self.max_to_keep)
+        if step is not None:
+            self.saver.restore(sess, '%s-%d' % (model_file, step))
+            return step
         step = 0
         checkpoint_dir = os.path.dirname(model_file)
         if os.path.isdir(checkpoint_dir):
             checkpoint = tf.train.get_checkpoint_state(checkpoint_dir)
             step = int( checkpoint.model_checkpoint_path.split("-")[1].split(".")[0])
             self.saver.restore(sess,checkpoint.model_checkpoint_path)
-        return step
\ No newline at end of file
+        return step
+
+#%%
+
+def tile_beam(tensor, beam_width, axis= 0):
+    # Repeat every batch row beam_width times along axis, so that row
+    # b * beam_width + k holds beam k of batch entry b
+    static_shape = tensor.get_shape().as_list()
+    tensor = tf.expand_dims(tensor, axis + 1)
+    multiples = [1] * (len(static_shape) + 1)
+    multiples[axis + 1] = beam_width
+    tensor = tf.tile(tensor, multiples)
+    shape = tf.shape(tensor)
+    tensor = tf.reshape(tensor, tf.concat([shape[:axis], [-1], shape[axis + 2:]], 0))
+    tensor.set_shape(static_shape[:axis] + [None] + static_shape[axis + 1:])
+    return tensor
+
+
+def greedy_search(step_fn, state, batch_size, BOS_tag, EOS_tag, max_step, sampling):
+    # Decodes in a tf.while_loop that stops as soon as every row has emitted
+    # EOS_tag. Finished rows keep emitting EOS_tag, lengths count the words
+    # before it.
+    word = tf.fill([batch_size], BOS_tag)
+    finished = tf.zeros([batch_size], dtype= tf.bool)
+    lengths = tf.zeros([batch_size], dtype= tf.int32)
+    captions = tf.TensorArray(dtype= tf.int32, size= 0, dynamic_size= True)
+    
+    def cond(step, word, state, finished, lengths, captions):
+        return tf.logical_and(step < max_step, tf.logical_not(tf.reduce_all(finished)))
+    
+    def body(step, word, state, finished, lengths, captions):
+        logits, state = step_fn(word, state)
+        if sampling:
+            word = tf.squeeze(tf.multinomial(logits, 1), axis= 1)
+        else:
+            word = tf.argmax(logits, axis= 1)
+        word = tf.where(finished, tf.fill([batch_size], EOS_tag), tf.cast(word, dtype= tf.int32))
+        
+        finished = tf.logical_or(finished, tf.equal(word, EOS_tag))
+        lengths += tf.cast(tf.logical_not(finished), tf.int32)
+        captions = captions.write(step, word)
+        return step + 1, word, state, finished, lengths, captions
+    
+    _, _, _, _, lengths, captions = tf.while_loop(
+            cond, body,
+            loop_vars= [tf.constant(0), word, state, finished, lengths, captions])
+    
+    captions = tf.transpose(captions.stack(), [1, 0])
+    return captions, lengths
+
+
+def beam_search(step_fn, state, batch_size, BOS_tag, EOS_tag, vocab_size, max_step,
+                beam_width, length_penalty):
+    # Beams are extra batch rows, so all hypotheses of the whole batch advance
+    # with one step_fn call (one projection matmul) per step. The loop stops
+    # as soon as every beam has emitted EOS_tag.
+    nest = tf.contrib.framework.nest
+    state = nest.map_structure(lambda s: tile_beam(s, beam_width), state)
+    
+    word = tf.fill([batch_size * beam_width], BOS_tag)
+    log_probs = tf.tile([[0.] + [-1e9] * (beam_width - 1)], [batch_size, 1])
+    finished = tf.zeros([batch_size, beam_width], dtype= tf.bool)
+    lengths = tf.zeros([batch_size, beam_width], dtype= tf.int32)
+    sequences = tf.zeros([batch_size, beam_width, 0], dtype= tf.int32)
+    
+    # A finished beam can only be extended by EOS_tag, at no cost
+    eos_log_probs = tf.one_hot(EOS_tag, vocab_size, on_value= 0., off_value= -1e9)
+    eos_log_probs = tf.tile(tf.expand_dims(eos_log_probs, 0), [batch_size * beam_width, 1])
+    beam_offset = tf.expand_dims(tf.range(batch_size) * beam_width, 1)
+    
+    def gather_beam(tensor, parent):
+        shape = tf.shape(tensor)
+        tensor = tf.reshape(tensor, tf.concat([[batch_size * beam_width], shape[2:]], 0))
+        return tf.reshape(tf.gather(tensor, parent), shape)
+    
+    def cond(step, word, state, log_probs, finished, lengths, sequences):
+        return tf.logical_and(step < max_step, tf.logical_not(tf.reduce_all(finished)))
+    
+    def body(step, word, state, log_probs, finished, lengths, sequences):
+        logits, state = step_fn(word, state)
+        step_log_probs = tf.where(tf.reshape(finished, [-1]), eos_log_probs, tf.nn.log_softmax(logits))
+        step_log_probs = tf.reshape(step_log_probs, (-1, beam_width, vocab_size))
+        
+        # Best beam_width continuations out of beam_width * vocab_size
+        scores = tf.reshape(tf.expand_dims(log_probs, 2) + step_log_probs, (-1, beam_width * vocab_size))
+        log_probs, indices = tf.nn.top_k(scores, k= beam_width)
+        word = indices % vocab_size
+        parent = tf.reshape(indices // vocab_size + beam_offset, [-1])
+        
+        state = nest.map_structure(lambda s: tf.gather(s, parent), state)
+        finished = gather_beam(finished, parent)
+        lengths = gather_beam(lengths, parent) + tf.cast(tf.logical_not(finished), tf.int32)
+        sequences = tf.concat([gather_beam(sequences, parent), tf.expand_dims(word, 2)], 2)
+        finished = tf.logical_or(finished, tf.equal(word, EOS_tag))
+        
+        return step + 1, tf.reshape(word, [-1]), state, log_probs, finished, lengths, sequences
+    
+    _, _, _, log_probs, finished, lengths, sequences = tf.while_loop(
+            cond, body,
+            loop_vars= [tf.constant(0), word, state, log_probs, finished, lengths, sequences],
+            shape_invariants= [tf.TensorShape([]),
+                               word.get_shape(),
+                               nest.map_structure(lambda s: s.get_shape(), state),
+                               log_probs.get_shape(),
+                               finished.get_shape(),
+                               lengths.get_shape(),
+                               tf.TensorShape([None, beam_width, None])])
+    
+    # Length normalization: ((5 + length) / 6) ** length_penalty
+    penalty = tf.pow((5. + tf.cast(lengths, tf.float32)) / 6., length_penalty)
+    best = tf.cast(tf.argmax(log_probs / penalty, axis= 1), tf.int32)
+    best = tf.range(batch_size) * beam_width + best
+    
+    captions = tf.gather(tf.reshape(sequences, (batch_size * beam_width, -1)), best)
+    finished = tf.gather(tf.reshape(finished, [-1]), best)
+    lengths = tf.gather(tf.reshape(lengths, [-1]), best) - tf.cast(finished, tf.int32)
+    return captions, lengths
@@ -8,8 +8,7 @@ Created on Mon Apr 16 00:33:44 2018
 
 import tensorflow as tf
 from rnn_models import RnnModel_Attention
-import numpy as np
-from dataset import DataSet
+from dataset import DataSet, BatchPrefetcher
 import data_preprocessing as DP
 import argparse
 import json
@@ -18,9 +17,11 @@ import os
 ##### Training file path #####
 
 dict_file = 'dictionary.txt'
-train_label_file = './translated_training_label.json'
+train_packed_file = './translated_training_label'
 train_path = './MLDS_hw2_1_data/training_data/feat/'
 test_path = './MLDS_hw2_1_data/testing_data/feat/'
+train_feat_file = './MLDS_hw2_1_data/training_data/feat.npy'
+test_feat_file = './MLDS_hw2_1_data/testing_data/feat.npy'
 test_id_path = './MLDS_hw2_1_data/testing_id.txt'
 model_file = './s2s_attention/model.ckpt'
 
@@ -41,6 +42,8 @@ N_hidden = 256
 N_epoch = 1000
 max_seq_len = 30
 save_step = 20
+test_batch_size = 100
+length_penalty = 0.6
 
 params = {}
 params['cell_type'] = 'lstm'
@@ -48,14 +51,18 @@ params['batch_size'] = batch_size
 params['learning_rate'] = 0.001
 params['hidden_layers'] = 1
 params['dropout'] = 0.1
+params['num_sampled'] = 0 # > 0: sampled softmax training loss
+params['max_to_keep'] = 5
 
 ######################
 
 def run_train():
     # Inputs
     dictionary = DP.read_dictionary(dict_file)
-    train_label = DP.read_train(train_label_file)
-    train = DataSet(train_path, train_label, len(dictionary), dictionary[BOS_tag], dictionary[EOS_tag])
+    if not os.path.isfile(train_feat_file):
+        DP.pack_feat(train_path, DP.read_packed(train_packed_file)[3], train_feat_file)
+    train = DataSet(train_path, None, len(dictionary), dictionary[BOS_tag], dictionary[EOS_tag],
+                    feat_file= train_feat_file, packed_file= train_packed_file)
 
     # Parameters
     N_input = train.datalen
@@ -78,20 +85,15 @@ def run_train():
     with tf.Session(graph= graph) as sess:
         sess.run(tf.global_variables_initializer())
         step = train_model.restore_model(sess, model_file)
+        prefetcher = BatchPrefetcher(lambda: train.next_padded_batch(batch_size=batch_size))
 
         while step < N_iter:
-            batch_x, batch_y = train.next_batch(batch_size=batch_size)
-
-            y = np.full((batch_size, train.max_seq_len), dictionary[EOS_tag])
-            y_mask = np.zeros((batch_size, train.max_seq_len - 1))
-            for i, caption in enumerate(batch_y):
-                y[i,:len(caption)] = caption
-                y_mask[i, :len(caption)] = 1.0
+            batch_x, batch_input, batch_target, batch_mask = prefetcher.next_batch()
 
             feed_dict = {tf_video: batch_x,
-                         tf_decoder_input: y[:, :-1],
-                         tf_decoder_target: y[:, 1:],
-                         tf_decoder_mask: y_mask}
+                         tf_decoder_input: batch_input,
+                         tf_decoder_target: batch_target,
+                         tf_decoder_mask: batch_mask}
             _, train_loss = sess.run([train_step, loss], feed_dict=feed_dict)
             step += 1
             print('step: %d, train_loss: %f' % (step, train_loss))
@@ -100,36 +102,40 @@ def run_train():
                 train_model.save_model(sess, model_file, step)
                 print('----- Saving Model -----')
 
+        prefetcher.close()
         train_model.save_model(sess, model_file, step)
         print('----- Saving Model -----')
 
 
-def run_test(sampling):
-    # Inputs
-    dictionary = DP.read_dictionary(dict_file)
-    inverse_dictionary = {dictionary[key]:key for key in dictionary}
-
+def pack_test_feat():
+    # Testing IDs, test_feat_file is packed on first use
     ID = []
     with open(test_id_path) as f:
         for line in f:
             ID.append(line[:-1])
 
-    features = []
-    for id in ID:
-        feature = np.load(test_path + id + '.npy')
-        features.append(feature)
-    features = np.asarray(features)
+    if not os.path.isfile(test_feat_file):
+        DP.pack_feat(test_path, ID, test_feat_file)
+    return ID
+
+def run_test(sampling, beam_width= 1, step= None, config= None):
+    # Inputs
+    dictionary = DP.read_dictionary(dict_file)
+    inverse_dictionary = {dictionary[key]:key for key in dictionary}
+
+    ID = pack_test_feat()
+    features, feat_index = DP.read_feat(test_feat_file)
     
     # Parameters
     N_input = len(ID)
     feat_timestep = features.shape[1]
     feat_dim = features.shape[2]
     vocab_size = len(dictionary)
-    print('Total testing steps: %d' % N_input)
+    print('Total testing steps: %d' % ((N_input - 1) // test_batch_size + 1))
 
     graph = tf.Graph()
     with graph.as_default():
-        params['batch_size'] = 1
+        params['batch_size'] = test_batch_size
         test_model = RnnModel_Attention(
                         is_training= False,
                         image_dim = feat_dim,
@@ -139,32 +145,32 @@ def run_test(sampling):
                         N_caption_step = max_seq_len,
                         **params)
 
-        tf_video, tf_decoder_input, captions = test_model.build_test_model(sampling)
+        if beam_width > 1:
+            tf_video, captions, caption_lengths = test_model.build_beam_search_model(
+                    dictionary[BOS_tag], dictionary[EOS_tag], beam_width, length_penalty)
+        else:
+            tf_video, captions, caption_lengths = test_model.build_greedy_search_model(
+                    dictionary[BOS_tag], dictionary[EOS_tag], sampling)
 
-    with tf.Session(graph= graph) as sess:
+    with tf.Session(graph= graph, config= config) as sess:
         sess.run(tf.global_variables_initializer())
-        step = test_model.restore_model(sess, model_file)
+        step = test_model.restore_model(sess, model_file, step)
         print('Restore the model with step %d' % (step))
         
         result = []
-        for idx, x in enumerate(features):
-            caption = {}
-            caption['caption'] = [BOS_tag]
-            caption['id'] = ID[idx]
-
-            x = x.reshape(1, feat_timestep, feat_dim)
-            
-            begin = np.array([dictionary[caption['caption'][0]]]).reshape(1, 1)
-            feed_dict = {tf_video: x, tf_decoder_input: begin}
-            predictions = sess.run(captions, feed_dict= feed_dict)
-            for word_idx in predictions:
-                word = inverse_dictionary[word_idx]
-                if word == EOS_tag:
-                    break
-                caption['caption'].append(word)
-
-            caption['caption'] = caption['caption'][1:]
-            result.append(caption)
+        for idx in range(0, N_input, test_batch_size):
+            batch_id = ID[idx : idx + test_batch_size]
+            x = features[[feat_index[id] for id in batch_id]]
+
+            feed_dict = {tf_video: x}
+            predictions, lengths = sess.run([captions, caption_lengths], feed_dict= feed_dict)
+
+            # Every row is cut at its own <EOS>
+            for id, prediction, length in zip(batch_id, predictions, lengths):
+                caption = {}
+                caption['caption'] = [inverse_dictionary[word_idx] for word_idx in prediction[:length]]
+                caption['id'] = id
+                result.append(caption)
             
         return result
 
@@ -188,10 +194,14 @@ if __name__ == '__main__':
                         action= 'store_true',
                         default= False,
                         help= 'test task')
+    parser.add_argument('--beam_width',
+                        type= int,
+                        default= 1,
+                        help= 'beam search width, 1 for greedy/sampling')
 
     arg = parser.parse_args()
     if arg.train:
         run_train()
     if arg.test:
-        result = run_test(arg.sampling)
+        result = run_test(arg.sampling, arg.beam_width)
         write_result(result)
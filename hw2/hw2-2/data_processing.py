@@ -10,6 +10,8 @@ import numpy as np
 import argparse
 import re
 import json
+import os
+import multiprocessing
 from collections import Counter
 
 
@@ -100,6 +102,90 @@ def read_train(filename):
   return data
 
 
+def shard_corpus(data_path, N_shard):
+  # Byte ranges [start, end) of the corpus, each cut right after a
+  # '+++$+++' line so that no dialog spans two shards
+  file_size = os.path.getsize(data_path)
+  bounds = [0]
+  with open(data_path, 'rb') as data:
+    for idx in range(1, N_shard):
+      position = max(file_size * idx // N_shard, bounds[-1])
+      data.seek(position)
+      if position > 0:
+        data.readline()
+      line = data.readline()
+      while line and line.rstrip(b'\r\n') != b'+++$+++':
+        line = data.readline()
+      bounds.append(data.tell())
+  bounds.append(file_size)
+  return [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+
+def tokenize_shard(args):
+  # Counts and encodes one shard in a single pass with a shard-local
+  # vocabulary. Returns the local words, their counts, the flat local
+  # token ids and the word count of every sentence and sentence count of
+  # every dialog.
+  data_path, start, end = args
+  vocab = {}
+  tokens = []
+  sentence_len = []
+  dialog_len = []
+  N_sentence = 0
+  with open(data_path, 'rb') as data:
+    data.seek(start)
+    while data.tell() < end:
+      sentence = data.readline().decode('utf8').rstrip('\r\n')
+      if sentence == '+++$+++':
+        dialog_len.append(N_sentence)
+        N_sentence = 0
+        continue
+      words = sentence.split()
+      tokens.extend(vocab.setdefault(word, len(vocab)) for word in words)
+      sentence_len.append(len(words))
+      N_sentence += 1
+  if N_sentence > 0:
+    dialog_len.append(N_sentence)
+  
+  tokens = np.asarray(tokens, dtype= np.int32)
+  counts = np.bincount(tokens, minlength= len(vocab))
+  words = sorted(vocab, key= vocab.get)
+  return words, counts, tokens, np.asarray(sentence_len, dtype= np.int64), np.asarray(dialog_len, dtype= np.int64)
+
+
+def tokenize_corpus(data_path, N_worker= None):
+  if N_worker is None:
+    N_worker = multiprocessing.cpu_count()
+  shards = [(data_path, start, end) for start, end in shard_corpus(data_path, N_worker)]
+  with multiprocessing.Pool(N_worker) as pool:
+    return pool.map(tokenize_shard, shards)
+
+
+def pack_label(dictionary, shards, packed_file= None):
+  # Remaps the shard-local ids into the dictionary and concatenates the
+  # shards into flat int32 tokens plus sentence and dialog offsets
+  tokens = []
+  for words, _, shard_tokens, _, _ in shards:
+    lookup = np.asarray([dictionary.get(word, dictionary['<UNK>']) for word in words], dtype= np.int32)
+    tokens.append(lookup[shard_tokens])
+  tokens = np.concatenate(tokens)
+  sentence_offsets = np.concatenate([[0], np.cumsum(np.concatenate([shard[3] for shard in shards]))])
+  dialog_offsets = np.concatenate([[0], np.cumsum(np.concatenate([shard[4] for shard in shards]))])
+  
+  if packed_file is not None:
+    np.save(packed_file + '_token.npy', tokens)
+    np.save(packed_file + '_sentence.npy', sentence_offsets.astype(np.int64))
+    np.save(packed_file + '_dialog.npy', dialog_offsets.astype(np.int64))
+  return tokens, sentence_offsets, dialog_offsets
+
+
+def read_packed(packed_file):
+  # Memory-mapped (tokens, sentence_offsets, dialog_offsets) written by pack_label
+  return (np.load(packed_file + '_token.npy', mmap_mode= 'r'),
+          np.load(packed_file + '_sentence.npy', mmap_mode= 'r'),
+          np.load(packed_file + '_dialog.npy', mmap_mode= 'r'))
+
+
 def main():
   parser = argparse.ArgumentParser(description= 'Create dictionary.txt and process training_label')
   parser.add_argument('--train_data',
@@ -110,13 +196,24 @@ def main():
                       type= str,
                       help= 'dictionary path',
                       required= True)
+  parser.add_argument('--packed_file',
+                      type= str,
+                      help= 'prefix of the packed translated label files',
+                      default= 'translated_training_label')
+  parser.add_argument('--workers',
+                      type= int,
+                      help= 'tokenizer processes, defaults to cpu count',
+                      default= None)
   args = parser.parse_args()
   
-  counter = build_counter(args.train_data)
+  shards = tokenize_corpus(args.train_data, args.workers)
+  counter = Counter()
+  for words, counts, _, _, _ in shards:
+    counter.update(dict(zip(words, counts.tolist())))
   counter = denoise(counter, word_frequency= 3)
   counter.update(['<EOS>', '<BOS>', '<UNK>'])
   dictionary = build_dict(counter, args.dictionary_path)
-  translate_label(dictionary, args.train_data, 'translated_training_label.json')
+  pack_label(dictionary, shards, args.packed_file)
 #%%
 
 if __name__ == '__main__':
@@ -7,41 +7,53 @@ Created on Fri May 11 11:41:11 2018
 """
 
 import numpy as np
+import queue
+import threading
+import data_processing as DP
+
+
+def to_array(sentences):
+  # np.asarray of the sentences, a 1-D object array when they are ragged
+  try:
+    return np.asarray(sentences)
+  except ValueError:
+    array = np.empty(len(sentences), dtype= object)
+    array[:] = sentences
+    return array
+
 
 class DataSet:
-  def __init__(self, captions, vocab_size, BOS_tag, EOS_tag):
-    self._caption = []
-    self._train_x = []
-    self._train_y = []
-    self._max_seq_len = 0
-    
-    current_idx = 0
-    for caption in captions:
-      caption_length = len(caption)
-      for idx, sentence in enumerate(caption):
-        sentence.append(EOS_tag)
-        sentence = [BOS_tag] + sentence
-        self._caption.append(np.asarray(sentence))
-        if self._max_seq_len < len(sentence):
-          self._max_seq_len = len(sentence)
-        
-        if idx >= (caption_length - 1):
-          current_idx += 1
-          break
-        self._train_x.append(current_idx)
-        self._train_y.append(current_idx + 1)
-        current_idx += 1
-      
-    self._caption = np.asarray(self._caption)
-    self._train_x = np.asarray(self._train_x)
-    self._train_y = np.asarray(self._train_y)
+  def __init__(self, captions, vocab_size, BOS_tag, EOS_tag, bucket_boundaries= None, packed_file= None):
+    if packed_file is not None:
+      # Memory-mapped tokens and offsets written by DP.pack_label
+      self._tokens, self._offsets, dialog_offsets = DP.read_packed(packed_file)
+    else:
+      sentences = [sentence for caption in captions for sentence in caption]
+      self._offsets = np.zeros(len(sentences) + 1, dtype= np.int64)
+      np.cumsum([len(sentence) for sentence in sentences], out= self._offsets[1:])
+      self._tokens = np.fromiter((word for sentence in sentences for word in sentence),
+                                 dtype= np.int32, count= self._offsets[-1])
+      dialog_offsets = np.cumsum([0] + [len(caption) for caption in captions])
+    
+    # Sentence i is <BOS> _tokens[_offsets[i]:_offsets[i + 1]] <EOS>
+    self._caption_len = (np.diff(self._offsets) + 2).astype(np.int32)
+    self._max_seq_len = int(np.amax(self._caption_len))
+    
+    # Every sentence but the last one of its dialog is paired with the next
+    has_reply = np.ones(len(self._caption_len), dtype= bool)
+    has_reply[dialog_offsets[1:][np.diff(dialog_offsets) > 0] - 1] = False
+    self._train_x = np.flatnonzero(has_reply)
+    self._train_y = self._train_x + 1
     self._datalen = len(self._train_x)
     
     self._vocab_size = vocab_size
+    self._BOS_tag = BOS_tag
+    self._EOS_tag = EOS_tag
     self._index_in_epoch = 0
     self._N_epoch = 1
     
     self.shuffle_data()
+    self.build_buckets(bucket_boundaries)
     
     
   def next_batch(self, batch_size = 1):
@@ -54,11 +66,70 @@ class DataSet:
         
         self._index_in_epoch = 0
         self._N_epoch += 1
-      x.append(np.asarray(self._caption[self._train_x[self._index_in_epoch]]))
-      y.append(np.asarray(self._caption[self._train_y[self._index_in_epoch]]))
+      x.append(self.sentence(self._train_x[self._index_in_epoch]))
+      y.append(self.sentence(self._train_y[self._index_in_epoch]))
       self._index_in_epoch += 1
     
-    return np.asarray(x), np.asarray(y)
+    return to_array(x), to_array(y)
+  
+  
+  def build_buckets(self, bucket_boundaries= None):
+    # A pair goes to the bucket of its longer side. Without boundaries the
+    # quartiles of the pair lengths are used.
+    pair_len = np.maximum(self._caption_len[self._train_x], self._caption_len[self._train_y])
+    if bucket_boundaries is None:
+      bucket_boundaries = np.unique(np.percentile(pair_len, [25, 50, 75]).astype(np.int32))
+    bucket_id = np.digitize(pair_len, bucket_boundaries, right= True)
+    self._buckets = [np.flatnonzero(bucket_id == idx) for idx in range(len(bucket_boundaries) + 1)]
+    self._buckets = [bucket for bucket in self._buckets if len(bucket) > 0]
+    self._bucket_batches = []
+    self._index_in_bucket_epoch = 0
+    
+    
+  def shuffle_buckets(self, batch_size):
+    # Shuffle within every bucket, cut it into batches, then shuffle the
+    # batches across buckets
+    self._bucket_batches = []
+    for bucket in self._buckets:
+      bucket = np.random.permutation(bucket)
+      self._bucket_batches.extend(np.split(bucket, np.arange(batch_size, len(bucket), batch_size)))
+    np.random.shuffle(self._bucket_batches)
+    self._index_in_bucket_epoch = 0
+    
+    
+  def next_bucket_batch(self, batch_size = 1):
+    # Pairs of one length bucket, padded only to the longest sentence of
+    # the batch. Returns x, x_mask, y_input, y_target, y_mask.
+    if not self._bucket_batches:
+      self.shuffle_buckets(batch_size)
+    elif self._index_in_bucket_epoch >= len(self._bucket_batches):
+      self.shuffle_buckets(batch_size)
+      self._N_epoch += 1
+    pairs = self._bucket_batches[self._index_in_bucket_epoch]
+    self._index_in_bucket_epoch += 1
+    
+    x, x_len = self.pad(self._train_x[pairs])
+    y, y_len = self.pad(self._train_y[pairs])
+    x_mask = (np.arange(x.shape[1]) < x_len[:, None]).astype(np.float32)
+    y_mask = (np.arange(y.shape[1] - 1) < y_len[:, None]).astype(np.float32)
+    return x, x_mask, y[:, :-1], y[:, 1:], y_mask
+  
+  
+  def pad(self, sentence_idx):
+    # EOS-padded [len(sentence_idx), max_len] matrix of the given sentences
+    length = self._caption_len[sentence_idx]
+    position = np.arange(np.amax(length))
+    is_word = (position > 0) & (position < length[:, None] - 1)
+    word_idx = np.where(is_word, self._offsets[sentence_idx][:, None] + position - 1, 0)
+    matrix = np.where(is_word, self._tokens[word_idx], self._EOS_tag).astype(np.int32)
+    matrix[:, 0] = self._BOS_tag
+    return matrix, length
+  
+  
+  def sentence(self, idx):
+    return np.concatenate(([self._BOS_tag],
+                           self._tokens[self._offsets[idx]:self._offsets[idx + 1]],
+                           [self._EOS_tag])).astype(np.int32)
   
   
   def shuffle_data(self):
@@ -70,7 +141,11 @@ class DataSet:
     
   @property
   def caption(self):
-    return self._caption
+    return [self.sentence(idx) for idx in range(len(self._caption_len))]
+
+  @property
+  def caption_len(self):
+    return self._caption_len
     
   @property
   def train_x(self):
@@ -101,6 +176,50 @@ class DataSet:
     return self._N_epoch
 
 
+class BatchPrefetcher:
+  # Calls batch_fn on a worker thread and keeps up to capacity batches
+  # queued, so host-side batch preparation overlaps with sess.run. The
+  # DataSet is only touched by the worker, which keeps its shuffle/epoch
+  # order unchanged.
+  def __init__(self, batch_fn, capacity= 8):
+    self._batch_fn = batch_fn
+    self._queue = queue.Queue(maxsize= capacity)
+    self._stop = threading.Event()
+    self._error = None
+    self._thread = threading.Thread(target= self._run)
+    self._thread.daemon = True
+    self._thread.start()
+    
+  def _put(self, item):
+    while not self._stop.is_set():
+      try:
+        self._queue.put(item, timeout= 0.1)
+        return
+      except queue.Full:
+        continue
+    
+  def _run(self):
+    try:
+      while not self._stop.is_set():
+        self._put(self._batch_fn())
+    except Exception as e:
+      # Kept, so every later next_batch raises it instead of blocking
+      self._error = e
+      self._put(e)
+      
+  def next_batch(self):
+    if self._error is not None and self._queue.empty():
+      raise self._error
+    batch = self._queue.get()
+    if isinstance(batch, Exception):
+      raise batch
+    return batch
+  
+  def close(self):
+    self._stop.set()
+    self._thread.join()
+
+
 def test_main():
   import data_processing as DP
   
@@ -14,6 +14,7 @@ class RnnModel_Attention:
     self.learning_rate = params['learning_rate']
     self.hidden_layers = params['hidden_layers']
     self.dropout = params['dropout']
+    self.num_sampled = params.get('num_sampled', 0) # 0: full softmax loss
 
 
     if self.cell_type == 'rnn':
@@ -66,9 +67,14 @@ class RnnModel_Attention:
         
     
   def attention(self, image_states, key):
+    # Batch size of the graph being built, dynamic for the search graph
+    batch_size = image_states.get_shape().as_list()[2]
+    if batch_size is None:
+      batch_size = tf.shape(image_states)[2]
+
     key_flatten = tf.reshape(tf.squeeze(tf.stack(key)), (-1, self.N_hidden))
     key_scores = tf.matmul(key_flatten, self.key_weight) + self.key_bias
-    key_scores = tf.reshape(key_scores, (2, self.batch_size, self.N_hidden))
+    key_scores = tf.reshape(key_scores, (2, batch_size, self.N_hidden))
     
     image_states = tf.add(tf.transpose(image_states, [1, 0, 2, 3]), key_scores)
     image_states = tf.transpose(image_states, [1, 0, 2, 3])
@@ -76,66 +82,83 @@ class RnnModel_Attention:
     
     scores = tf.matmul(image_states_flatten, self.states_weight) + self.states_bias
     scores = tf.reshape(scores,
-                shape= (2, -1, self.batch_size, 1))
+                shape= (2, -1, batch_size, 1))
     scores = tf.nn.softmax(tf.transpose(scores, [0, 2, 1, 3]), 2)
     scores = tf.transpose(scores, [0, 2, 1, 3])
     
     weighted_states = tf.multiply(image_states_flatten, tf.reshape(scores, (-1, 1)))
-    weighted_states = tf.reshape(weighted_states, (2, -1, self.batch_size, self.N_hidden))
+    weighted_states = tf.reshape(weighted_states, (2, -1, batch_size, self.N_hidden))
     weighted_states = tf.reduce_sum(tf.transpose(weighted_states,[0, 2, 1, 3]), 2)
     
     return (tf.contrib.rnn.LSTMStateTuple(c= weighted_states[0], h= weighted_states[1]),)
 
 
+  def encode(self, encoder_input_embeded, batch_size):
+    # One tf.scan over the input steps instead of a dynamic_rnn per word.
+    # Variables live under the same encoder/rnn scope dynamic_rnn used.
+    state = self.encoder_multi_cells.zero_state(batch_size, dtype= tf.float32)
+    with tf.variable_scope('encoder', reuse= tf.get_variable_scope().reuse):
+      with tf.variable_scope('rnn'):
+        states = tf.scan(lambda state, embeded: self.encoder_multi_cells(embeded, state)[1],
+                         tf.transpose(encoder_input_embeded, [1, 0, 2]),
+                         initializer= state)
+
+    # First layer (c, h) of every step: [2, N_caption_step, batch_size, N_hidden]
+    input_states = tf.stack(states[0])
+    state = tf.contrib.framework.nest.map_structure(lambda s: s[-1], states)
+    return input_states, state
+
+
+  def decode_output(self, word, state, image_states):
+    # One attention + decoder step on a [batch] vector of words, same
+    # variables as the dynamic_rnn decoder
+    state = self.attention(image_states, state[0])
+    word_embeded = tf.nn.embedding_lookup(self.word_emdeded, word)
+    with tf.variable_scope('decoder', reuse= tf.get_variable_scope().reuse):
+      with tf.variable_scope('rnn'):
+        decoder_output, state = self.decoder_multi_cells(word_embeded, state)
+    return decoder_output, state
+
+
+  def decode_step(self, word, state, image_states):
+    decoder_output, state = self.decode_output(word, state, image_states)
+    decoder_logits = tf.matmul(decoder_output, self.word_weight) + self.word_bias
+    return decoder_logits, state
+
+
   def build_train_model(self):
-    # Inputs
+    # Inputs, batch and time are left open so bucketed batches are only
+    # padded to their own longest sentence
     encoder_input = tf.placeholder(dtype=tf.int32,
-            shape=[self.batch_size, self.N_caption_step])
+            shape=[None, None])
     encoder_mask = tf.placeholder(dtype= tf.float32,
-            shape= [self.batch_size, None])
+            shape= [None, None])
     decoder_input = tf.placeholder(dtype=tf.int32,
-            shape=[self.batch_size, None])
+            shape=[None, None])
     decoder_target = tf.placeholder(dtype=tf.int32,
-            shape=[self.batch_size, None])
+            shape=[None, None])
     decoder_mask = tf.placeholder(dtype= tf.float32,
-            shape= [self.batch_size, None])
+            shape= [None, None])
+    batch_size = tf.shape(encoder_input)[0]
   
     # word embeded to size: N_hidden
     encoder_input_embeded = tf.nn.embedding_lookup(self.word_emdeded, encoder_input)
   
-    # LSTM parameters
-    state = self.encoder_multi_cells.zero_state(self.batch_size, dtype= tf.float32)
-
     # Encoding Stage
-    with tf.variable_scope('encoder', reuse= tf.get_variable_scope().reuse):
-      input_states = []
-      for idx in range(self.N_caption_step):
-        embeded = tf.expand_dims(encoder_input_embeded[:,idx,:], 1)
-        _, state = tf.nn.dynamic_rnn(self.encoder_multi_cells, embeded, initial_state= state)
-        mask = tf.expand_dims(encoder_mask[:,idx], -1)
-        input_states.append((state[0][0] * mask, state[0][1] * mask))
-      input_states = tf.stack(input_states, 1)
+    input_states, state = self.encode(encoder_input_embeded, batch_size)
+    input_states = input_states * tf.expand_dims(tf.expand_dims(tf.transpose(encoder_mask), 0), -1)
   
-    # Decoding Stage
-    decoder_input_embeded = tf.nn.embedding_lookup(self.word_emdeded, decoder_input)
-    with tf.variable_scope('decoder', reuse= tf.get_variable_scope().reuse):   
-      decoder_outputs = []
-      for idx in range(self.N_caption_step - 1):
-        state = self.attention(input_states, state[0])
-        embeded = tf.expand_dims(decoder_input_embeded[:, idx, :], 1)
-        output, state = tf.nn.dynamic_rnn(self.decoder_multi_cells, embeded, initial_state= state)
-        decoder_outputs.append(output)
+    # Decoding Stage, one tf.scan over the decoder input steps
+    decoder_outputs, _ = tf.scan(
+            lambda previous, word: self.decode_output(word, previous[1], input_states),
+            tf.transpose(decoder_input, [1, 0]),
+            initializer= (tf.zeros([batch_size, self.N_hidden]), state))
                       
-    # Project N_hidden into vocab_size
-    decoder_outputs = tf.squeeze(tf.stack(decoder_outputs, 1))
-    decoder_output_flatten = tf.reshape(decoder_outputs, (-1, self.N_hidden))
-    decoder_logits = tf.matmul(decoder_output_flatten, self.word_weight) + self.word_bias
-    decoder_logits = tf.reshape(decoder_logits, (self.batch_size, -1, self.vocab_size))
-
     # Loss
-    stepwise_cross_entropy = tf.nn.softmax_cross_entropy_with_logits(
-            labels= tf.one_hot(decoder_target, depth= self.vocab_size, dtype=tf.float32),
-            logits= decoder_logits)
+    decoder_outputs = tf.transpose(decoder_outputs, [1, 0, 2])
+    decoder_output_flatten = tf.reshape(decoder_outputs, (-1, self.N_hidden))
+    stepwise_cross_entropy = sequence_loss(decoder_output_flatten, decoder_target,
+                                           self.word_weight, self.word_bias, self.num_sampled)
     stepwise_cross_entropy = tf.multiply(stepwise_cross_entropy, decoder_mask)
 
     loss = tf.reduce_mean(tf.reduce_sum(stepwise_cross_entropy, axis= 1))
@@ -168,51 +191,75 @@ class RnnModel_Attention:
     return step
   
 
-  def build_test_model(self, sampling= False):
+  def build_greedy_search_model(self, BOS_tag, EOS_tag, sampling= False):
     # Inputs
     encoder_input = tf.placeholder(dtype=tf.int32,
-            shape=[self.batch_size, self.N_caption_step])
-    decoder_input = tf.placeholder(dtype=tf.int32,
-            shape=[self.batch_size, None])
+            shape=[None, self.N_caption_step])
+    batch_size = tf.shape(encoder_input)[0]
 
     # word embeded to size: N_hidden
     encoder_input_embeded = tf.nn.embedding_lookup(self.word_emdeded, encoder_input)
 
-    # RNN parameters
-    state = self.encoder_multi_cells.zero_state(self.batch_size, dtype= tf.float32)
-    captions = []
-        
     # Encoding Stage
-    with tf.variable_scope('encoder', reuse= tf.get_variable_scope().reuse):
-      image_states = []
-      for idx in range(self.N_caption_step):
-        embeded = tf.expand_dims(encoder_input_embeded[:,idx,:], 1)
-        _, state = tf.nn.dynamic_rnn(self.encoder_multi_cells, embeded, initial_state= state)
-        image_states.append(state[0])
-      image_states = tf.stack(image_states, 1)
+    image_states, state = self.encode(encoder_input_embeded, batch_size)
 
     # Decoding Stage
-    decoder_input_embeded = tf.nn.embedding_lookup(self.word_emdeded, decoder_input)
-    with tf.variable_scope('decoder', reuse= tf.get_variable_scope().reuse):   
-      for idx in range(self.N_caption_step):
-        state = self.attention(image_states, state[0])
-        decoder_output, state = tf.nn.dynamic_rnn(self.decoder_multi_cells, decoder_input_embeded, initial_state= state)
-                      
-        # Project N_hidden into vocab_size
-        decoder_output_flatten = tf.reshape(decoder_output, (-1, self.N_hidden))
-        decoder_logits = tf.matmul(decoder_output_flatten, self.word_weight) + self.word_bias
-        decoder_logits = tf.reshape(decoder_logits, (self.batch_size, self.vocab_size))
-        
-        probs = tf.nn.softmax(decoder_logits)
-        if sampling:
-          best_choice = tf.multinomial(tf.log(probs), 1)
-        else:
-          best_choice = tf.expand_dims(tf.argmax(decoder_logits, axis= 1), axis= -1)
-        best_choice = tf.cast(best_choice, dtype= tf.int32)
-        captions.append(best_choice)
-        
-        decoder_input_embeded = tf.nn.embedding_lookup(self.word_emdeded, best_choice)
+    step_fn = lambda word, state: self.decode_step(word, state, image_states)
+    captions, lengths = greedy_search(step_fn, state, batch_size, BOS_tag, EOS_tag,
+                                      self.N_caption_step, sampling)
+    return encoder_input, captions, lengths
+
+
+#%%
+def sequence_loss(outputs, targets, word_weight, word_bias, num_sampled= 0):
+  # Per-step cross entropy of the [batch * step, N_hidden] outputs against
+  # [batch, step] integer targets. Sparse labels avoid the one-hot tensor;
+  # with num_sampled > 0 the loss only projects onto the target and
+  # num_sampled sampled words instead of the whole vocabulary.
+  labels = tf.reshape(targets, [-1])
+  if num_sampled > 0:
+    cross_entropy = tf.nn.sampled_softmax_loss(
+            weights= tf.transpose(word_weight),
+            biases= word_bias,
+            labels= tf.expand_dims(tf.cast(labels, tf.int64), -1),
+            inputs= outputs,
+            num_sampled= num_sampled,
+            num_classes= word_weight.get_shape().as_list()[1])
+  else:
+    logits = tf.matmul(outputs, word_weight) + word_bias
+    cross_entropy = tf.nn.sparse_softmax_cross_entropy_with_logits(
+            labels= labels, logits= logits)
+  return tf.reshape(cross_entropy, tf.shape(targets))
+
+
+def greedy_search(step_fn, state, batch_size, BOS_tag, EOS_tag, max_step, sampling):
+  # Decodes in a tf.while_loop that stops as soon as every row has emitted
+  # EOS_tag. Finished rows keep emitting EOS_tag, lengths count the words
+  # before it.
+  word = tf.fill([batch_size], BOS_tag)
+  finished = tf.zeros([batch_size], dtype= tf.bool)
+  lengths = tf.zeros([batch_size], dtype= tf.int32)
+  captions = tf.TensorArray(dtype= tf.int32, size= 0, dynamic_size= True)
+
+  def cond(step, word, state, finished, lengths, captions):
+    return tf.logical_and(step < max_step, tf.logical_not(tf.reduce_all(finished)))
+
+  def body(step, word, state, finished, lengths, captions):
+    logits, state = step_fn(word, state)
+    if sampling:
+      word = tf.squeeze(tf.multinomial(logits, 1), axis= 1)
+    else:
+      word = tf.argmax(logits, axis= 1)
+    word = tf.where(finished, tf.fill([batch_size], EOS_tag), tf.cast(word, dtype= tf.int32))
+
+    finished = tf.logical_or(finished, tf.equal(word, EOS_tag))
+    lengths += tf.cast(tf.logical_not(finished), tf.int32)
+    captions = captions.write(step, word)
+    return step + 1, word, state, finished, lengths, captions
 
-    captions = tf.squeeze(tf.stack(captions, axis= 1))
-    return encoder_input, decoder_input, captions
+  _, _, _, _, lengths, captions = tf.while_loop(
+          cond, body,
+          loop_vars= [tf.constant(0), word, state, finished, lengths, captions])
 
+  captions = tf.transpose(captions.stack(), [1, 0])
+  return captions, lengths
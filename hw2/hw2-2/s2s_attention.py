@@ -9,7 +9,7 @@ Created on Sun Jun 10 15:11:25 2018
 import tensorflow as tf
 from rnn_models import RnnModel_Attention
 import numpy as np
-from dataset import DataSet
+from dataset import DataSet, BatchPrefetcher
 import data_processing as DP
 import argparse
 import json
@@ -20,7 +20,7 @@ import re
 ##### Training file path #####
 
 dict_file = 'dictionary.txt'
-train_label_file = './translated_training_label.json'
+train_packed_file = './translated_training_label'
 
 test_file = './mlds_hw2_2_data/test_input.txt'
 model_file = './s2s_attention/model.ckpt'
@@ -38,6 +38,7 @@ N_hidden = 512
 N_epoch = 1000
 max_seq_len = 30
 save_step = 20
+test_batch_size = 100
 
 params = {}
 params['cell_type'] = 'lstm'
@@ -45,14 +46,15 @@ params['batch_size'] = batch_size
 params['learning_rate'] = 0.0001
 params['hidden_layers'] = 1
 params['dropout'] = 0.1
+params['num_sampled'] = 0 # > 0: sampled softmax training loss
 
 ##############################
 
 def run_train():
   # Inputs
   dictionary = DP.read_dictionary(dict_file)
-  train_data = DP.read_train(train_label_file)
-  train = DataSet(train_data, len(dictionary), dictionary[BOS_tag], dictionary[EOS_tag])
+  train = DataSet(None, len(dictionary), dictionary[BOS_tag], dictionary[EOS_tag],
+                  packed_file= train_packed_file)
 
   N_input = train.datalen
   N_iter = N_input * N_epoch // batch_size
@@ -72,24 +74,15 @@ def run_train():
   with tf.Session(graph= graph) as sess:
     sess.run(tf.global_variables_initializer())
     step = train_model.restore_model(sess, model_file)
+    prefetcher = BatchPrefetcher(lambda: train.next_bucket_batch(batch_size=batch_size))
 
     while step < N_iter:
-      batch_x, batch_y = train.next_batch(batch_size=batch_size)
-
-      x = np.full((batch_size, train.max_seq_len), dictionary[EOS_tag])
-      y = np.full((batch_size, train.max_seq_len), dictionary[EOS_tag])
-      x_mask = np.zeros((batch_size, train.max_seq_len))
-      y_mask = np.zeros((batch_size, train.max_seq_len - 1))
-      for i in range(batch_size):
-        x[i,:len(batch_x[i])] = batch_x[i]
-        y[i,:len(batch_y[i])] = batch_y[i]
-        x_mask[i, :len(batch_x[i])] = 1.0
-        y_mask[i, :len(batch_y[i])] = 1.0
+      x, x_mask, y_input, y_target, y_mask = prefetcher.next_batch()
 
       feed_dict = {tf_encoder_input: x,
                    tf_encoder_mask: x_mask,
-                   tf_decoder_input: y[:, :-1],
-                   tf_decoder_target: y[:, 1:],
+                   tf_decoder_input: y_input,
+                   tf_decoder_target: y_target,
                    tf_decoder_mask: y_mask}
       _, train_loss = sess.run([train_step, loss], feed_dict=feed_dict)
       step += 1
@@ -99,6 +92,7 @@ def run_train():
         train_model.save_model(sess, model_file, step)
         print('----- Saving Model -----')
 
+    prefetcher.close()
     train_model.save_model(sess, model_file, step)
     print('----- Saving Model -----')
 
@@ -128,7 +122,7 @@ def run_test(sampling):
 
   graph = tf.Graph()
   with graph.as_default():
-    params['batch_size'] = 1
+    params['batch_size'] = test_batch_size
     test_model = RnnModel_Attention(
               is_training= False,
               vocab_size = vocab_size,
@@ -136,7 +130,8 @@ def run_test(sampling):
               N_caption_step = test_max_seq_length,
               **params)
 
-    tf_encoder_input, tf_decoder_input, captions = test_model.build_test_model(sampling)
+    tf_encoder_input, captions, caption_lengths = test_model.build_greedy_search_model(
+              dictionary[BOS_tag], dictionary[EOS_tag], sampling)
 
   with tf.Session(graph= graph) as sess:
     sess.run(tf.global_variables_initializer())
@@ -144,23 +139,18 @@ def run_test(sampling):
     print('Restore the model with step %d' % (step))
     
     result = []
-    for idx, sentence in enumerate(test):
-      caption = [BOS_tag]  
-      x = np.full((1, test_max_seq_length), dictionary[EOS_tag])
-      x[0,:len(sentence)] = sentence
+    for start in range(0, N_input, test_batch_size):
+      batch = test[start:start + test_batch_size]
+      x = np.full((len(batch), test_max_seq_length), dictionary[EOS_tag])
+      for idx, sentence in enumerate(batch):
+        x[idx,:len(sentence)] = sentence
       
-      begin = np.array([dictionary[caption[0]]]).reshape(1, 1)
-      feed_dict = {tf_encoder_input: x, tf_decoder_input: begin}
-      predictions = sess.run(captions, feed_dict= feed_dict)
-      for word_idx in predictions:
-        word = inverse_dictionary[word_idx]
-        if word == EOS_tag:
-          break
-        caption.append(word)
-      if idx == 10:
-	      break
-      caption = caption[1:]
-      result.append(caption)
+      feed_dict = {tf_encoder_input: x}
+      predictions, lengths = sess.run([captions, caption_lengths], feed_dict= feed_dict)
+
+      # Every row is cut at its own <EOS>
+      for prediction, length in zip(predictions, lengths):
+        result.append([inverse_dictionary[word_idx] for word_idx in prediction[:length]])
             
     return result
 